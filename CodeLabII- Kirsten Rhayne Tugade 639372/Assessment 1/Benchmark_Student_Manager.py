@@ -0,0 +1,209 @@
+"""
+************************************
+
+     Student Manager Benchmarks
+
+************************************
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+import Exercise3_Student_Manager as sm
+
+SIZES = (10_000, 100_000, 1_000_000)
+REPEATS = 3  # each case keeps its best time
+
+# Regression thresholds. Cases that walk the whole cohort are limited in
+# microseconds per student, the index lookups in milliseconds per call.
+PER_ROW_US = {
+    "load_students": 15.0,
+    "save_students": 8.0,
+    "filter": 0.5,
+    "sort": 1.0,
+    "sort_name": 5.0,
+    "cohort_stats": 0.2,
+    "regrade": 0.3,
+    "regrade_indexed": 0.3,
+    "tk_load": 30.0,
+    "tk_sort_records": 20.0,
+}
+PER_CALL_MS = {
+    "show_highest": 1.0,
+    "top_10": 1.0,
+    "tk_populate_table": 50.0,
+    "tk_filter_table": 80.0,
+    "tk_show_highest": 50.0,
+}
+
+FIRST = ["Amelia", "Noah", "Olivia", "Liam", "Ava", "Ethan", "Isla", "Lucas", "Mia", "Omar",
+         "Priya", "Kenji", "Sofia", "Mateo", "Zara", "Hana", "Yusuf", "Elena", "Kofi", "Rhayne"]
+LAST = ["Smith", "Garcia", "Nguyen", "Okafor", "Tanaka", "Kowalski", "Silva", "Haddad",
+        "Murphy", "Tugade", "Ivanova", "Chen", "Patel", "Rossi", "Larsen", "Mensah"]
+
+# Synthetic data
+
+def generate_marks(filename, rows, seed=639372):
+    # Writes rows students in the studentMarks.txt layout (class size first).
+    # Codes are unique and marks roughly bell shaped, like a real cohort.
+    rng = random.Random(seed)
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(f"{rows}\n")
+        batch = []
+        for i in range(rows):
+            ability = rng.gauss(0.6, 0.15)
+            cw = [max(0, min(20, round(rng.gauss(ability * 20, 3)))) for _ in range(3)]
+            exam = max(0, min(100, round(rng.gauss(ability * 100, 12))))
+            batch.append(f"{1000 + i},{rng.choice(FIRST)} {rng.choice(LAST)},{cw[0]},{cw[1]},{cw[2]},{exam}\n")
+            if len(batch) == 10_000:
+                f.writelines(batch); batch = []
+        f.writelines(batch)
+
+# Timing
+
+def best_of(fn, repeats=REPEATS):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def core_cases(filename, workdir):
+    # Store, index and file operations without any window
+    results = {}
+    results["load_students"] = best_of(lambda: sm.load_students(filename))
+    students = sm.load_students(filename)
+    search = students.attach(sm.SearchIndex())
+    ranks = students.attach(sm.MarkIndex())
+    out = os.path.join(workdir, "saved.txt")
+    results["save_students"] = best_of(lambda: sm.save_students(students, out))
+    results["filter"] = best_of(lambda: (search.search("smi", students), search.search("10", students)))
+    results["sort"] = best_of(lambda: sm.SortCache().order(students, "percent"))
+    results["sort_name"] = best_of(lambda: sm.SortCache().order(students, "name"))
+    results["show_highest"] = best_of(lambda: students.get(ranks.highest()))
+    results["top_10"] = best_of(lambda: ranks.top(10))
+    results["cohort_stats"] = best_of(lambda: sm.cohort_stats(students))
+    # moving the A boundary from 70 to 65 regrades roughly a tenth of a cohort
+    def regrade(index=None):
+        old = sm.set_grade_boundaries([("A", 65), *sm.DEFAULT_GRADE_BOUNDARIES[1:]])
+        sm.regrade(students, old, index)
+        sm.set_grade_boundaries(sm.DEFAULT_GRADE_BOUNDARIES)
+    results["regrade"] = best_of(regrade)
+    results["regrade_indexed"] = best_of(lambda: regrade(ranks))
+    return results
+
+def tk_cases(filename, workdir):
+    # The same operations through the window; needs a display (e.g. run under xvfb-run)
+    work = os.path.join(workdir, "tk.txt")
+    shutil.copy(filename, work)
+    results = {}
+    start = time.perf_counter()
+    app = sm.StudentManager(work)
+    while app._loader is not None:
+        app.update()
+    results["tk_load"] = time.perf_counter() - start
+    try:
+        def pump(fn):
+            def run():
+                fn(); app.update_idletasks()
+            return run
+        results["tk_populate_table"] = best_of(pump(app._populate_table))
+        def search():
+            app.search_var.set("smi"); app.filter_table()
+        results["tk_filter_table"] = best_of(pump(search))
+        app.search_var.set("")
+        results["tk_show_highest"] = best_of(pump(app.show_highest))
+        def sort():
+            app.sort_records(False); app._io.submit(lambda: None).result()
+        results["tk_sort_records"] = best_of(pump(sort))
+    finally:
+        app._io.shutdown(wait=True)
+        app.destroy()
+    return results
+
+def display_available():
+    try:
+        root = sm.tk.Tk()
+    except sm.tk.TclError:
+        return False
+    root.destroy()
+    return True
+
+# Thresholds
+
+def check(results, baseline=None, tolerance=1.25):
+    # Returns the list of cases that went over their limit, or that got slower
+    # than tolerance x the matching case in a previous JSON report
+    failures = []
+    for size, cases in results.items():
+        for case, seconds in cases.items():
+            if case in PER_ROW_US:
+                limit = PER_ROW_US[case] * int(size) / 1e6
+            elif case in PER_CALL_MS:
+                limit = PER_CALL_MS[case] / 1e3
+            else:
+                continue
+            if seconds > limit:
+                failures.append(f"{case} @ {size}: {seconds:.4f}s > limit {limit:.4f}s")
+            old = (baseline or {}).get(size, {}).get(case)
+            # very short cases are too noisy to compare run to run
+            if old and seconds > 0.05 and seconds > old * tolerance:
+                failures.append(f"{case} @ {size}: {seconds:.4f}s vs baseline {old:.4f}s")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time Student Manager operations on synthetic cohorts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--output", help="write the JSON report here as well as printing it")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--no-tk", action="store_true", help="skip the cases that open a window")
+    args = parser.parse_args(argv)
+
+    use_tk = not args.no_tk and display_available()
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": getattr(sm.np, "__version__", None),
+        "tk": "run" if use_tk else "skipped (no display)" if not args.no_tk else "skipped",
+        "results": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="sm-bench-")
+    try:
+        for size in args.sizes:
+            filename = os.path.join(workdir, f"marks-{size}.txt")
+            start = time.perf_counter()
+            generate_marks(filename, size)
+            cases = {"generate": time.perf_counter() - start}
+            cases.update(core_cases(filename, workdir))
+            if use_tk:
+                cases.update(tk_cases(filename, workdir))
+            report["results"][str(size)] = {k: round(v, 6) for k, v in cases.items()}
+            print(f"{size:>9} rows: " + ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in cases.items()), file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    report["failures"] = check(report["results"], baseline, args.tolerance)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,21 +10,168 @@
 
 
 import tkinter as tk
+import os
+import mmap
 import random
+import struct
+import hashlib
 import winsound
+from array import array
+
+
+# JOKE SOURCE
+# The jokes file is memory-mapped and only one number per joke is kept: the
+# byte offset its line starts at. A joke is decoded and split when it is
+# picked, so a corpus of millions costs 8 bytes a joke rather than two
+# strings. The offsets are cached next to the text file as <jokes file>.idx,
+# stamped with its mtime, size and SHA-1; a warm start reads just that array,
+# and a file that changed is re-indexed.
+
+CACHE_HEADER = struct.Struct("<6sqQ20sQ")  # magic, mtime_ns, size, sha1, joke count
+CACHE_MAGIC = b"JOKIX2"
+
+def split_joke(line):
+    # "setup?punchline" -> ("setup?", "punchline"); None when there is no "?"
+    setup, mark, punchline = line.strip().partition("?")
+    return (setup + "?", punchline.strip()) if mark else None
+
+class JokeSource:
+    # Read-only sequence of (setup, punchline) tuples, so random.choice works on it
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # an empty file cannot be mapped
+                self.data = b""
+        self.offsets, self.from_cache = self._load_offsets()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self.offsets)
+        if not 0 <= i < len(self.offsets): raise IndexError(i)
+        start = self.offsets[i]
+        end = self.data.find(b"\n", start)
+        return split_joke(self.data[start:end if end >= 0 else len(self.data)].decode("utf-8"))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap): self.data.close()
+
+    def _load_offsets(self):
+        st = os.stat(self.filename)
+        cache = self.filename + ".idx"
+        try:
+            with open(cache, "rb") as f:
+                magic, mtime, size, digest, count = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                if magic == CACHE_MAGIC and size == st.st_size and (mtime == st.st_mtime_ns or digest == self._sha1()):
+                    offsets = array("Q")
+                    offsets.fromfile(f, count)
+                    if mtime != st.st_mtime_ns:
+                        self._write_cache(cache, st, digest, offsets)  # touched but unchanged
+                    return offsets, True
+        except (OSError, EOFError, struct.error):
+            pass
+        offsets, pos = array("Q"), 0
+        data = self.data
+        while pos < len(data):
+            end = data.find(b"\n", pos)
+            end = len(data) if end < 0 else end + 1
+            if data.find(b"?", pos, end) >= 0:
+                offsets.append(pos)
+            pos = end
+        self._write_cache(cache, st, self._sha1(), offsets)
+        return offsets, False
+
+    def _sha1(self):
+        return hashlib.sha1(self.data).digest()
+
+    @staticmethod
+    def _write_cache(cache, st, digest, offsets):
+        try:
+            with open(cache + ".tmp", "wb") as f:
+                f.write(CACHE_HEADER.pack(CACHE_MAGIC, st.st_mtime_ns, st.st_size, digest, len(offsets)))
+                offsets.tofile(f)
+            os.replace(cache + ".tmp", cache)
+        except OSError:
+            pass  # read-only folder: the jokes still load, just without a cache
+
+
+# JOKE DECK
+# Every joke is dealt once, in shuffled order, before any repeats. Draw k
+# deals joke perm(k), where perm is a keyed 4-round Feistel network over the
+# smallest even power of two covering the deck; outputs past the end are fed
+# back in until they land inside it. It is a bijection, so nothing but the
+# seed and position is kept, and these are saved to <jokes file>.deck so the
+# next start carries on where the deck stopped without replaying any draws.
+
+DECK_VERSION = 2  # version 1 decks replayed a Fisher-Yates shuffle
+
+class JokeDeck:
+    def __init__(self, jokes, state_file=None):
+        self.jokes = jokes
+        self.state_file = state_file
+        seed, position = self._load_state()
+        self._shuffle(seed)
+        self.position = min(position, len(jokes))
+
+    def _shuffle(self, seed=None):
+        self.seed = random.randrange(2 ** 63) if seed is None else seed
+        self.position = 0
+        self.half = (max(len(self.jokes) - 1, 1).bit_length() + 1) // 2
+        self.keys = [hashlib.blake2b(f"{self.seed}:{r}".encode(), digest_size=8).digest() for r in range(4)]
+
+    def _permute(self, i):
+        mask = (1 << self.half) - 1
+        while True:
+            left, right = i >> self.half, i & mask
+            for key in self.keys:
+                f = hashlib.blake2b(right.to_bytes(8, "little"), digest_size=8, key=key).digest()
+                left, right = right, left ^ (int.from_bytes(f, "little") & mask)
+            i = (left << self.half) | right
+            if i < len(self.jokes):
+                return i
+
+    def _next_index(self):
+        pick = self._permute(self.position)
+        self.position += 1
+        return pick
+
+    def draw(self):
+        if not self.jokes:
+            return None
+        if self.position >= len(self.jokes):
+            self._shuffle()  # end of the deck: start a new cycle
+        joke = self.jokes[self._next_index()]
+        self._save_state()
+        return joke
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                seed, position, count, version = (int(v) for v in f.read().split())
+            if count == len(self.jokes) and version == DECK_VERSION:
+                return seed, position
+        except (TypeError, OSError, ValueError):
+            pass
+        return None, 0
+
+    def _save_state(self):
+        if not self.state_file: return
+        try:
+            with open(self.state_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write(f"{self.seed} {self.position} {len(self.jokes)} {DECK_VERSION}\n")
+            os.replace(self.state_file + ".tmp", self.state_file)
+        except OSError:
+            pass  # the deck still works, it just starts over next time
 
 
 # LOAD JOKES FROM FILE
 
 def load_jokes(filename="randomJokes.txt"):
-    jokes = []
     try:
-        with open(filename, "r", encoding="utf-8") as file:
-            for line in file:
-                line = line.strip()
-                if "?" in line:
-                    setup, punchline = line.split("?", 1)
-                    jokes.append((setup + "?", punchline.strip()))
+        jokes = JokeSource(filename)
     except FileNotFoundError:
         jokes = [("File not found!", "Please ensure randomJokes.txt is in the folder.")]
     return jokes
@@ -49,6 +196,7 @@ class AlexaJokeApp:
         self.root.geometry("540x360")
         self.root.config(bg="#0b1a2a")
         self.jokes = load_jokes()
+        self.deck = JokeDeck(self.jokes, self.jokes.filename + ".deck" if isinstance(self.jokes, JokeSource) else None)
         self.current_joke = None
 
         # Title Label
@@ -150,7 +298,9 @@ class AlexaJokeApp:
 
     def show_joke(self):
         self.punchline_label.config(text="")
-        self.current_joke = random.choice(self.jokes)
+        self.current_joke = self.deck.draw()
+        if self.current_joke is None:
+            self.joke_label.config(text="> No jokes found in randomJokes.txt."); return
         self.joke_label.config(text="> " + self.current_joke[0])
 
     def show_punchline(self):
@@ -7,74 +7,1336 @@
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import os
+import re
+import sys
+import csv
+import json
+import mmap
+import queue
+import sqlite3
+import struct
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # the statistics panel falls back to plain Python
+    np = None
+from array import array
+from bisect import bisect_left, bisect_right, insort
 
 DATA_FILE = "studentMarks.txt"
+CHUNK_SIZE = 2000
+COMPACT_AFTER = 500  # journal entries before the marks file is rewritten
+TABLE_OVERSCAN = 20  # rows rendered above and below the visible part of the table
+SEARCH_DELAY_MS = 150
+SAVE_DELAY_MS = 300  # edits made within this window are written together
+WATCH_INTERVAL_MS = 2000
+GRADE_FILE = "gradeBoundaries.txt"
+DEFAULT_GRADE_BOUNDARIES = (("A", 70), ("B", 60), ("C", 50), ("D", 40), ("F", 0))
+UNDO_LIMIT = 100  # history steps kept for undo
+TABLE_DIFF_LIMIT = 50  # changes beyond this redraw the view instead of diffing it
+TIMING_LOG = "timings.log"
+TIMING_LOG_BYTES = 1024 * 1024  # the log is rolled over to timings.log.1 past this size
+TIMING_SEP = "   |   "
+
+# Grade boundaries
+#
+# Boundaries are (grade, minimum percent) pairs, best grade first, ending with
+# a minimum of 0. They are read from GRADE_FILE, one "grade,minimum" per line.
+# Every possible overall mark (0-160) is graded once into GRADE_BY_OVERALL, so
+# a student's grade is a list lookup; calculate_grade bisects the cut-offs.
+
+GRADE_BOUNDARIES = []
+GRADE_NAMES = []       # best first
+GRADE_BY_OVERALL = []
+_grade_cutoffs = []    # minimums above 0, ascending
+_grade_letters = []    # worst first, one more than _grade_cutoffs
+
+def set_grade_boundaries(boundaries):
+    # Returns the previous GRADE_BY_OVERALL so callers can see what moved
+    boundaries = [(str(g).strip(), float(p)) for g, p in boundaries]
+    names, mins = [g for g, _ in boundaries], [p for _, p in boundaries]
+    if (not boundaries or mins[-1] != 0 or mins[0] > 100 or any(a <= b for a, b in zip(mins, mins[1:]))
+            or len(set(names)) != len(names) or any(not g or "," in g for g in names)):
+        raise ValueError("Grades must be distinct, with minimums falling from at most 100 down to 0")
+    old = list(GRADE_BY_OVERALL)
+    # the lists are updated in place so every reference to them stays current
+    GRADE_BOUNDARIES[:] = boundaries
+    GRADE_NAMES[:] = names
+    _grade_cutoffs[:] = mins[-2::-1]
+    _grade_letters[:] = names[::-1]
+    GRADE_BY_OVERALL[:] = [calculate_grade((overall / 160) * 100) for overall in range(161)]
+    return old
+
+def load_grade_boundaries(filename=GRADE_FILE):
+    # Falls back to the defaults when there is no file; a bad file raises ValueError
+    boundaries = DEFAULT_GRADE_BOUNDARIES
+    if os.path.exists(filename):
+        with open(filename, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        try:
+            boundaries = [(g, float(p)) for g, p in (line.split(",") for line in lines)]
+        except ValueError:
+            raise ValueError(f"{filename}: expected lines of grade,minimum percent")
+    return set_grade_boundaries(boundaries)
+
+def save_grade_boundaries(filename=GRADE_FILE):
+    with open(filename, "w", encoding="utf-8") as f:
+        for g, p in GRADE_BOUNDARIES:
+            f.write(f"{g},{p:g}\n")
 
 # Utility functions
 
 def calculate_grade(percent: float) -> str:
-    if percent >= 70:
-        return "A"
-    if percent >= 60:
-        return "B"
-    if percent >= 50:
-        return "C"
-    if percent >= 40:
-        return "D"
-    return "F"
-
-def load_students(filename=DATA_FILE):
-    students = []
-    if not os.path.exists(filename):
-        open(filename, "w").close()
-        return students
+    return _grade_letters[bisect_right(_grade_cutoffs, percent)]
 
+set_grade_boundaries(DEFAULT_GRADE_BOUNDARIES)
+
+def parse_student_line(line):
+    # Returns (code, name, c1, c2, c3, exam), or None if the line is malformed
+    parts = [p.strip() for p in line.split(",")]
+    if len(parts) < 6:
+        return None
+    code, name = parts[0], parts[1]
     try:
-        with open(filename, "r", encoding="utf-8") as f:
-            lines = [ln.strip() for ln in f if ln.strip()]
-        for line in lines:
-            parts = [p.strip() for p in line.split(",")]
-            if len(parts) < 6:
+        c1, c2, c3, exam = int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5])
+    except ValueError:
+        return None
+    if not code or not name or not all(0 <= m <= 20 for m in (c1, c2, c3)) or not 0 <= exam <= 100:
+        return None
+    return code, name, c1, c2, c3, exam
+
+def decode_student_line(raw):
+    # Returns the stripped text of a raw line, or None if it is not valid UTF-8
+    try:
+        return raw.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        return None
+
+def iter_student_chunks(filename=DATA_FILE, chunk_size=CHUNK_SIZE, stats=None, start=0, partial=True):
+    # Streams the file from byte offset start and yields lists of at most
+    # chunk_size students. Lines that fail validation are counted in
+    # stats["malformed"]; stats["offset"] is the byte position read up to.
+    # With partial=False a last line without its newline is left unread, as
+    # its writer may still be part way through it.
+    if stats is None:
+        stats = {}
+    stats.setdefault("rows", 0); stats.setdefault("malformed", 0)
+    stats["offset"] = start
+    chunk = []
+    with open(filename, "rb") as f:
+        f.seek(start)
+        for raw in f:
+            if not partial and not raw.endswith(b"\n"):
+                break
+            first = stats["offset"] == 0
+            stats["offset"] += len(raw)
+            line = decode_student_line(raw)
+            if line is None:
+                stats["malformed"] += 1
                 continue
-            code, name = parts[0], parts[1]
-            try:
-                c1, c2, c3, exam = int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5])
-            except ValueError:
+            if not line:
                 continue
-            cw_total = c1 + c2 + c3
-            overall = cw_total + exam
-            percent = (overall / 160) * 100
-            grade = calculate_grade(percent)
-            students.append({
-                "code": code,
-                "name": name,
-                "c1": c1,
-                "c2": c2,
-                "c3": c3,
-                "cw_total": cw_total,
-                "exam": exam,
-                "overall": overall,
-                "percent": percent,
-                "grade": grade
-            })
-    except Exception as exc:
-        messagebox.showerror("Load Error", f"Could not read {filename}:\n{exc}")
+            # The first line may hold the class size rather than a record
+            if first and line.isdigit():
+                continue
+            student = parse_student_line(line)
+            if student is None:
+                stats["malformed"] += 1
+                continue
+            chunk.append(student)
+            stats["rows"] += 1
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+# Record store
+#
+# Students are held column by column: codes and names in lists, marks in
+# unsigned byte arrays. The derived fields (cw_total, overall, percent, grade)
+# are computed when asked for instead of being stored. Measured with
+# tracemalloc at 100,000 students this is ~140 bytes per row (mostly the code
+# and name strings) against ~425 bytes per row for the old 10-key dicts.
+
+class StudentFields:
+    # Derived fields and dict-style access shared by every kind of record
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in STUDENT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    @property
+    def cw_total(self): return self.c1 + self.c2 + self.c3
+    @property
+    def overall(self): return self.cw_total + self.exam
+    @property
+    def percent(self): return (self.overall / 160) * 100
+    @property
+    def grade(self): return GRADE_BY_OVERALL[self.overall]
+
+    def fields(self):
+        return self.code, self.name, self.c1, self.c2, self.c3, self.exam
+
+class Student(StudentFields):
+    # A standalone record, e.g. one parsed on demand from the marks file
+    __slots__ = ("code", "name", "c1", "c2", "c3", "exam")
+
+    def __init__(self, code, name, c1, c2, c3, exam):
+        self.code, self.name, self.c1, self.c2, self.c3, self.exam = code, name, c1, c2, c3, exam
+
+class StudentRecord(StudentFields):
+    # Lightweight view onto one row of a StudentStore, read like the old dicts
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __eq__(self, other):
+        return isinstance(other, StudentRecord) and other.store is self.store and other.row == self.row
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    @property
+    def code(self): return self.store.codes[self.row]
+    @property
+    def name(self): return self.store.names[self.row]
+    @property
+    def c1(self): return self.store.c1[self.row]
+    @property
+    def c2(self): return self.store.c2[self.row]
+    @property
+    def c3(self): return self.store.c3[self.row]
+    @property
+    def exam(self): return self.store.exam[self.row]
+
+STUDENT_FIELDS = ("code", "name", "c1", "c2", "c3", "cw_total", "exam", "overall", "percent", "grade")
+# the store columns each integer mark is summed from
+MARK_COLUMNS = {"c1": ("c1",), "c2": ("c2",), "c3": ("c3",), "exam": ("exam",),
+                "cw_total": ("c1", "c2", "c3"), "overall": ("c1", "c2", "c3", "exam")}
+
+class StudentStore:
+    # Deleted rows are only marked dead so removal is O(1); they are squeezed
+    # out once they outnumber the live rows. self.index maps code -> row.
+    # Secondary indexes registered with attach() are told about every change
+    # through their add(record) / discard(record) methods.
+    def __init__(self, rows=()):
+        self.codes = []
+        self.names = []
+        self.c1 = array("B"); self.c2 = array("B"); self.c3 = array("B"); self.exam = array("B")
+        self.alive = bytearray()
+        self.index = {}
+        self.indexes = []
+        self.extend(rows)
+
+    def attach(self, index):
+        if hasattr(index, "build"):
+            index.build(self)
+        else:
+            for record in self:
+                index.add(record)
+        self.indexes.append(index)
+        return index
+
+    def __len__(self):
+        return len(self.index)
+
+    def live_codes(self):
+        # Codes of live rows in storage order (dead rows have an empty code)
+        return [c for c in self.codes if c]
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def __iter__(self):
+        return self.iter_rows()
+
+    def iter_rows(self, start=0):
+        alive = self.alive
+        for row in range(start, len(self.codes)):
+            if alive[row]:
+                yield StudentRecord(self, row)
+
+    @property
+    def row_count(self):
+        return len(self.codes)
+
+    def get(self, code):
+        row = self.index.get(code)
+        return None if row is None else StudentRecord(self, row)
+
+    def append(self, fields):
+        code, name, c1, c2, c3, exam = fields
+        if code in self.index:
+            raise ValueError(f"Duplicate student code {code}")
+        self.index[code] = len(self.codes)
+        self.codes.append(code); self.names.append(name)
+        self.c1.append(c1); self.c2.append(c2); self.c3.append(c3); self.exam.append(exam)
+        self.alive.append(1)
+        record = StudentRecord(self, len(self.codes) - 1)
+        for ix in self.indexes: ix.add(record)
+        return record
+
+    def extend(self, rows):
+        # Returns how many rows were skipped because their code was already taken
+        duplicates = 0
+        for fields in rows:
+            if fields[0] in self.index:
+                duplicates += 1
+            else:
+                self.append(fields)
+        return duplicates
+
+    def update(self, record, fields):
+        row = record.row
+        code, name, c1, c2, c3, exam = fields
+        if code != self.codes[row] and code in self.index:
+            raise ValueError(f"Duplicate student code {code}")
+        for ix in self.indexes: ix.discard(record)
+        if code != self.codes[row]:
+            del self.index[self.codes[row]]
+            self.index[code] = row
+        self.codes[row] = code; self.names[row] = name
+        self.c1[row] = c1; self.c2[row] = c2; self.c3[row] = c3; self.exam[row] = exam
+        for ix in self.indexes: ix.add(record)
+
+    def remove(self, record):
+        row = record.row
+        for ix in self.indexes: ix.discard(record)
+        del self.index[self.codes[row]]
+        self.alive[row] = 0
+        self.codes[row] = self.names[row] = ""
+        dead = len(self.codes) - len(self.index)
+        if dead > 1024 and dead > len(self.index):
+            self.compact()
+
+    def _reorder(self, order):
+        self.codes = [self.codes[r] for r in order]
+        self.names = [self.names[r] for r in order]
+        for col in ("c1", "c2", "c3", "exam"):
+            old = getattr(self, col)
+            setattr(self, col, array("B", (old[r] for r in order)))
+        self.alive = bytearray(b"\x01") * len(order)
+        self.index = {code: row for row, code in enumerate(self.codes)}
+
+    def compact(self):
+        self._reorder([r for r in range(len(self.codes)) if self.alive[r]])
+
+    def copy(self):
+        # Column-level copy (no secondary indexes) that a writer thread can iterate safely
+        other = StudentStore()
+        other.codes = self.codes[:]; other.names = self.names[:]
+        other.c1 = self.c1[:]; other.c2 = self.c2[:]; other.c3 = self.c3[:]; other.exam = self.exam[:]
+        other.alive = self.alive[:]
+        other.index = self.index.copy()
+        return other
+
+class SearchIndex:
+    # Trigram inverted index over lower-cased names (trigram -> set of codes)
+    # and a sorted list of lower-cased codes for prefix lookups. Discarded codes
+    # stay in code_keys and are skipped via self.gone until there are enough to
+    # purge, so an update that keeps the code never moves the list.
+    def __init__(self):
+        self.grams = {}
+        self.code_keys = []
+        self.gone = set()
+        self._unsorted = False  # code_keys is appended to and only sorted when next needed
+
+    @staticmethod
+    def _grams(name):
+        if len(name) < 3:
+            return {name}
+        return {name[i:i+3] for i in range(len(name) - 2)}
+
+    def add(self, s):
+        code = s["code"]
+        for g in self._grams(s["name"].lower()):
+            self.grams.setdefault(g, set()).add(code)
+        if code in self.gone:
+            self.gone.discard(code)  # its key is still in code_keys
+        elif self._unsorted or not self.code_keys:
+            self.code_keys.append((code.lower(), code))
+            self._unsorted = True
+        else:
+            insort(self.code_keys, (code.lower(), code))
+
+    def _sorted_codes(self):
+        if self._unsorted:
+            self.code_keys.sort()
+            self._unsorted = False
+        if len(self.gone) > 1024 and len(self.gone) * 8 > len(self.code_keys):
+            gone = self.gone
+            self.code_keys = [k for k in self.code_keys if k[1] not in gone]
+            gone.clear()
+        return self.code_keys
+
+    def discard(self, s):
+        code = s["code"]
+        for g in self._grams(s["name"].lower()):
+            bucket = self.grams.get(g)
+            if bucket is not None:
+                bucket.discard(code)
+                if not bucket: del self.grams[g]
+        self.gone.add(code)
+
+    def search(self, q, store):
+        # Codes of students whose name contains q or whose code starts with q
+        q = q.lower()
+        if len(q) >= 3:
+            buckets = sorted((self.grams.get(g, ()) for g in self._grams(q)), key=len)
+            found = set(buckets[0]).intersection(*buckets[1:])
+            found = {c for c in found if q in store.names[store.index[c]].lower()}
+        else:
+            # every substring shorter than a trigram lies inside some trigram key
+            found = set().union(*(codes for g, codes in self.grams.items() if q in g))
+        keys = self._sorted_codes()
+        i = bisect_left(keys, (q,))
+        while i < len(keys) and keys[i][0].startswith(q):
+            if keys[i][1] not in self.gone: found.add(keys[i][1])
+            i += 1
+        return sorted(found, key=store.index.__getitem__)
+
+class MarkIndex:
+    # Students bucketed by an integer mark field (overall by default, 0-160).
+    # percent is overall / 160, so bucket order is ranking order. A Fenwick tree
+    # over the bucket sizes answers rank, percentile and k-th queries in
+    # O(log size); each bucket is an insertion-ordered dict of codes.
+    def __init__(self, key="overall", size=161):
+        self.key = key
+        self.size = size
+        self.buckets = [{} for _ in range(size)]
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def __len__(self):
+        return self.total
+
+    def _bump(self, i, delta):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def count_below(self, value):
+        # Number of students whose mark is < value
+        i, n = min(max(value, 0), self.size), 0
+        while i > 0:
+            n += self.tree[i]
+            i -= i & -i
+        return n
+
+    def _bucket_of_kth(self, k):
+        # Bucket holding the k-th lowest student (1-based)
+        pos, step = 0, 1 << self.size.bit_length()
+        while step:
+            if pos + step <= self.size and self.tree[pos + step] < k:
+                pos += step
+                k -= self.tree[pos]
+            step >>= 1
+        return pos, k
+
+    def add(self, s):
+        b = s[self.key]
+        self.buckets[b][s["code"]] = None
+        self._bump(b, 1)
+        self.total += 1
+
+    def build(self, store):
+        # Same as add() for every live row, read straight from the mark columns
+        buckets = self.buckets
+        cols = [getattr(store, c) for c in MARK_COLUMNS[self.key]]
+        for code, alive, *marks in zip(store.codes, store.alive, *cols):
+            if alive: buckets[sum(marks)][code] = None
+        for b, bucket in enumerate(buckets):
+            if bucket: self._bump(b, len(bucket)); self.total += len(bucket)
+
+    def discard(self, s):
+        b = s[self.key]
+        if self.buckets[b].pop(s["code"], 0) is None:
+            self._bump(b, -1)
+            self.total -= 1
+
+    def kth(self, k):
+        # Code of the k-th lowest student (1-based)
+        b, offset = self._bucket_of_kth(k)
+        for i, code in enumerate(self.buckets[b]):
+            if i == offset - 1:
+                return code
+
+    def lowest(self):
+        return self.kth(1) if self.total else None
+
+    def highest(self):
+        if not self.total: return None
+        return next(iter(self.buckets[self._bucket_of_kth(self.total)[0]]))
+
+    def top(self, k):
+        codes = []
+        for b in range(self._bucket_of_kth(self.total)[0] if self.total else -1, -1, -1):
+            for code in self.buckets[b]:
+                if len(codes) == k: return codes
+                codes.append(code)
+        return codes
+
+    def bottom(self, k):
+        codes = []
+        for b in range(self._bucket_of_kth(1)[0] if self.total else self.size, self.size):
+            for code in self.buckets[b]:
+                if len(codes) == k: return codes
+                codes.append(code)
+        return codes
+
+    def rank(self, s):
+        # 1 = best; students with equal marks share a rank
+        return self.total - self.count_below(s[self.key] + 1) + 1
+
+    def percentile(self, s):
+        # Percentage of the cohort with a lower mark
+        return 100 * self.count_below(s[self.key]) / self.total if self.total else 0.0
+
+class SortCache:
+    # Sorted orders of the live codes, one per table column, built the first
+    # time that column is sorted on and dropped by any edit. The mark columns
+    # are argsorted straight from the store's byte arrays when NumPy is there.
+    # Derived columns sort by overall, and grade sorts best grade first.
+    def __init__(self):
+        self.orders = {}
+
+    def invalidate(self, s=None):
+        if self.orders: self.orders.clear()
+
+    add = discard = invalidate
+
+    @staticmethod
+    def sort_key(key):
+        # Per-record key, for sorting a few codes without building an order
+        if key in ("percent", "overall"): return lambda s: s.overall
+        if key == "grade": return lambda s: GRADE_NAMES.index(s.grade)
+        if key == "name": return lambda s: s.name.lower()
+        return lambda s: s[key]
+
+    def order(self, store, key):
+        codes = self.orders.get(key)
+        if codes is None:
+            codes = self.orders[key] = self._build(store, key)
+        return codes
+
+    def _build(self, store, key):
+        if key in ("code", "name"):
+            col = store.codes if key == "code" else [n.lower() for n in store.names]
+            rows = sorted((r for r, alive in enumerate(store.alive) if alive), key=col.__getitem__)
+        else:
+            cols = MARK_COLUMNS["overall" if key in ("percent", "grade") else key]
+            grade_rank = [GRADE_NAMES.index(g) for g in GRADE_BY_OVERALL] if key == "grade" else None
+            if np is not None:
+                vals = sum(np.frombuffer(getattr(store, c), dtype=np.uint8) for c in cols)
+                if grade_rank: vals = np.array(grade_rank)[vals]
+                live = np.flatnonzero(np.frombuffer(store.alive, dtype=np.uint8))
+                rows = live[np.argsort(vals[live], kind="stable")].tolist()
+            else:
+                vals = [sum(marks) for marks in zip(*(getattr(store, c) for c in cols))]
+                if grade_rank: vals = [grade_rank[v] for v in vals]
+                rows = sorted((r for r, alive in enumerate(store.alive) if alive), key=vals.__getitem__)
+        codes = store.codes
+        return [codes[r] for r in rows]
+
+# Queries
+#
+# A query is a list of comparisons joined with "and", e.g.
+#   grade == A        percent between 40 and 50        exam < 40 and cw_total > 45
+# Every queryable field is a small integer mark or derived from one (percent
+# and grade come from overall), so each comparison is first turned into the
+# list of marks it accepts. Each field has a MarkIndex (built on first use and
+# then kept up to date by the store); the planner counts the students in the
+# accepted buckets of every comparison, reads candidates from the most
+# selective one and checks only those against the rest.
+
+QUERY_FIELDS = {  # field -> (indexed mark, number of marks, mark -> field value)
+    "c1": ("c1", 21, None), "c2": ("c2", 21, None), "c3": ("c3", 21, None),
+    "exam": ("exam", 101, None), "cw_total": ("cw_total", 61, None), "overall": ("overall", 161, None),
+    "percent": ("overall", 161, lambda o: (o / 160) * 100), "grade": ("overall", 161, GRADE_BY_OVERALL.__getitem__),
+}
+QUERY_OPS = {"==": lambda a, b: a == b, "=": lambda a, b: a == b, "!=": lambda a, b: a != b,
+             "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b}
+QUERY_TOKEN = re.compile(r"\s*(\d+(?:\.\d+)?|[A-Za-z_][\w+-]*|==|!=|<=|>=|[<>=])")
+
+def parse_query(text):
+    # Returns [(field, text of the comparison, test(value))]; raises ValueError
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        m = QUERY_TOKEN.match(text, pos)
+        if not m: raise ValueError(f"Unexpected {text[pos:].strip()[:10]!r}")
+        tokens.append(m.group(1)); pos = m.end()
+    preds = []
+    while tokens:
+        field = tokens.pop(0).lower()
+        if field not in QUERY_FIELDS:
+            raise ValueError(f"Unknown field {field!r}; use one of {', '.join(QUERY_FIELDS)}")
+        if not tokens: raise ValueError(f"Missing comparison after {field}")
+        op = tokens.pop(0).lower()
+        if op == "between":
+            if len(tokens) < 3 or tokens[1].lower() != "and": raise ValueError("Use: field between LOW and HIGH")
+            args = [tokens[0], tokens[2]]; del tokens[:3]
+        elif op in QUERY_OPS:
+            if not tokens: raise ValueError(f"Missing value after {field} {op}")
+            args = [tokens.pop(0)]
+        else:
+            raise ValueError(f"Unknown comparison {op!r}")
+        if field == "grade":
+            if op not in ("==", "=", "!="): raise ValueError("Grades can only be compared with == or !=")
+            names = {g.lower(): g for g in GRADE_NAMES}
+            if args[0].lower() not in names: raise ValueError(f"Unknown grade {args[0]!r}")
+            value = names[args[0].lower()]
+        else:
+            try: value = [float(a) for a in args]
+            except ValueError: raise ValueError(f"{field} needs a number")
+        if op == "between":
+            lo, hi = value
+            test = lambda v, lo=lo, hi=hi: lo <= v <= hi
+        else:
+            value = value if field == "grade" else value[0]
+            test = lambda v, f=QUERY_OPS[op], x=value: f(v, x)
+        preds.append((field, f"{field} {op} {' and '.join(args)}", test))
+        if tokens:
+            if tokens.pop(0).lower() != "and": raise ValueError("Join comparisons with 'and'")
+            if not tokens: raise ValueError("Missing comparison after 'and'")
+    if not preds: raise ValueError("Empty query")
+    return preds
+
+class QueryEngine:
+    def __init__(self, store, overall_index=None):
+        self.store = store
+        self.indexes = {"overall": overall_index} if overall_index is not None else {}
+
+    def _index(self, key):
+        ix = self.indexes.get(key)
+        if ix is None:
+            ix = self.indexes[key] = self.store.attach(MarkIndex(key, QUERY_FIELDS[key][1]))
+        return ix
+
+    def run(self, text):
+        # Returns (codes in storage order, predicate, plan description, milliseconds)
+        started = time.perf_counter()
+        preds = parse_query(text)
+        plans = []
+        for i, (field, _, test) in enumerate(preds):
+            key, size, value_of = QUERY_FIELDS[field]
+            ix = self._index(key)
+            marks = [m for m in range(size) if test(value_of(m) if value_of else m)]
+            plans.append((sum(len(ix.buckets[m]) for m in marks), i, ix, marks))
+        estimate, best, ix, marks = min(plans, key=lambda p: p[0])
+        codes = [c for m in marks for c in ix.buckets[m]]
+        # the other comparisons are checked as "is this row's mark accepted"
+        rows = [self.store.index[c] for c in codes]
+        for i, (_, _, other, accepted) in enumerate(plans):
+            if i == best: continue
+            ok = [False] * QUERY_FIELDS[preds[i][0]][1]
+            for mark in accepted: ok[mark] = True
+            cols = [getattr(self.store, c) for c in MARK_COLUMNS[other.key]]
+            rows = [r for r in rows if ok[sum(col[r] for col in cols)]]
+        rows.sort()
+        codes = [self.store.codes[r] for r in rows]
+        match = lambda s: all(test(s[f]) for f, _, test in preds)
+        plan = f"{preds[best][1]} via {ix.key} index ({estimate} candidates)"
+        return codes, match, plan, (time.perf_counter() - started) * 1000
+
+# Cohort statistics
+#
+# Every mark is a small integer, so the whole cohort reduces to one histogram
+# per column (plus the coursework x exam products for correlation). With NumPy
+# those are built straight from the store's byte arrays in a single vectorised
+# pass; everything else is derived from the histograms.
+
+def _column_histograms(store):
+    cols = {"c1": store.c1, "c2": store.c2, "c3": store.c3, "exam": store.exam}
+    sizes = {"c1": 21, "c2": 21, "c3": 21, "exam": 101, "cw_total": 61, "overall": 161}
+    if np is not None:
+        data = {k: np.frombuffer(v, dtype=np.uint8) for k, v in cols.items()}
+        if len(store) != store.row_count:
+            alive = np.frombuffer(store.alive, dtype=np.uint8).astype(bool)
+            data = {k: v[alive] for k, v in data.items()}
+        # totals stay within uint8 (max 160); products go through float64, exact below 2**53
+        data["cw_total"] = data["c1"] + data["c2"] + data["c3"]
+        data["overall"] = data["cw_total"] + data["exam"]
+        hist = {k: np.bincount(data[k], minlength=sizes[k]).tolist() for k in sizes}
+        exam = data["exam"].astype(np.float64)
+        xy = {k: int(np.dot(data[k].astype(np.float64), exam)) for k in ("c1", "c2", "c3", "cw_total")}
+        return hist, xy
+    hist = {k: [0] * n for k, n in sizes.items()}
+    xy = dict.fromkeys(("c1", "c2", "c3", "cw_total"), 0)
+    for alive, c1, c2, c3, exam in zip(store.alive, store.c1, store.c2, store.c3, store.exam):
+        if not alive: continue
+        cw = c1 + c2 + c3
+        for k, v in (("c1", c1), ("c2", c2), ("c3", c3), ("exam", exam), ("cw_total", cw), ("overall", cw + exam)):
+            hist[k][v] += 1
+        xy["c1"] += c1 * exam; xy["c2"] += c2 * exam; xy["c3"] += c3 * exam; xy["cw_total"] += cw * exam
+    return hist, xy
+
+def _hist_quantile(hist, q):
+    # Same as numpy's default (linear) percentile, read off a histogram
+    n = sum(hist)
+    pos = q * (n - 1)
+    lo, frac = int(pos), pos - int(pos)
+    def value_at(k):
+        seen = 0
+        for v, count in enumerate(hist):
+            seen += count
+            if seen > k: return v
+    a = value_at(lo)
+    return a + frac * (value_at(lo + 1) - a) if frac else a
+
+def _hist_moments(hist):
+    n = sum(hist)
+    s1 = sum(v * c for v, c in enumerate(hist))
+    s2 = sum(v * v * c for v, c in enumerate(hist))
+    return n, s1, s2
+
+def cohort_stats(store):
+    hist, xy = _column_histograms(store)
+    n, s1, s2 = _hist_moments(hist["overall"])
+    if not n:
+        return {"count": 0}
+    scale = 100 / 160  # overall -> percent
+    mean = s1 / n
+    grades = {g: 0 for g in GRADE_NAMES}
+    for overall, count in enumerate(hist["overall"]):
+        grades[GRADE_BY_OVERALL[overall]] += count
+    _, ey, ey2 = _hist_moments(hist["exam"])
+    correlation = {}
+    for k in xy:
+        _, sx, sx2 = _hist_moments(hist[k])
+        var_x, var_y = n * sx2 - sx * sx, n * ey2 - ey * ey
+        correlation[k] = (n * xy[k] - sx * ey) / (var_x * var_y) ** 0.5 if var_x and var_y else 0.0
+    return {
+        "count": n,
+        "mean": mean * scale,
+        "std": max(s2 / n - mean * mean, 0) ** 0.5 * scale,
+        "q1": _hist_quantile(hist["overall"], 0.25) * scale,
+        "median": _hist_quantile(hist["overall"], 0.5) * scale,
+        "q3": _hist_quantile(hist["overall"], 0.75) * scale,
+        "grades": grades,
+        "histograms": {k: hist[k] for k in ("c1", "c2", "c3", "exam")},
+        "correlation": correlation,
+    }
+
+def regrade(store, old_table, index=None):
+    # Codes of the students whose grade differs between old_table and the
+    # current boundaries. Only overall marks whose grade moved are considered:
+    # with a MarkIndex on overall those are read straight from its buckets,
+    # otherwise the marks columns are summed and masked in one NumPy pass.
+    moved = [o for o in range(161) if old_table[o] != GRADE_BY_OVERALL[o]]
+    if not moved:
+        return []
+    if index is not None:
+        return [code for o in moved for code in index.buckets[o]]
+    if np is not None:
+        hit = np.zeros(161, dtype=bool); hit[moved] = True
+        overall = sum(np.frombuffer(c, dtype=np.uint8) for c in (store.c1, store.c2, store.c3, store.exam))
+        rows = np.flatnonzero(hit[overall] & np.frombuffer(store.alive, dtype=np.uint8).astype(bool))
+        codes = store.codes
+        return [codes[r] for r in rows.tolist()]
+    moved = set(moved)
+    return [s.code for s in store if s.overall in moved]
+
+def load_students(filename=DATA_FILE, stats=None):
+    # Reads a whole cohort without any GUI; errors are raised to the caller
+    students = StudentStore()
+    with open_backend(filename) as backend:
+        for chunk in backend.iter_chunks(stats=stats):
+            duplicates = students.extend(chunk)
+            if stats is not None:
+                stats["duplicates"] = stats.get("duplicates", 0) + duplicates
+        backend.replay(students, backend.read_journal(), stats)
     return students
 
+def format_student(s):
+    return f"{s['code']},{s['name']},{s['c1']},{s['c2']},{s['c3']},{s['exam']}"
+
+def write_snapshot(students, filename=DATA_FILE):
+    # Writes a fresh snapshot next to the file and renames it into place, so a
+    # crash part way through leaves the previous file intact. The journal is
+    # folded into the snapshot and can then be emptied.
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for s in students:
+            f.write(format_student(s) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp, filename)
+    journal = StudentJournal(filename)
+    if os.path.exists(journal.path):
+        journal.clear()
+    return size
+
 def save_students(students, filename=DATA_FILE):
-    try:
-        with open(filename, "w", encoding="utf-8") as f:
-            for s in students:
-                f.write(f"{s['code']},{s['name']},{s['c1']},{s['c2']},{s['c3']},{s['exam']}\n")
-    except Exception as exc:
-        messagebox.showerror("Save Error", f"Could not write to {filename}:\n{exc}")
+    with open_backend(filename) as backend:
+        backend.write_snapshot(students)
+
+# Export and reports
+#
+# Exports stream full records, derived fields included, as CSV or JSON Lines.
+# Rows are pulled from any iterable of records (a store, or a backend's chunks
+# straight off disk) and written CHUNK_SIZE at a time, so memory stays flat
+# however large the cohort. Per-student report files are rendered by a pool
+# of processes, with only a few batches in flight at once.
+
+EXPORT_FORMATS = (".csv", ".jsonl")
+REPORT_BATCH = 1000
+
+def export_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext in EXPORT_FORMATS else None
+
+def export_students(students, filename):
+    # Returns the number of students written
+    fmt = export_format(filename)
+    if fmt is None:
+        raise ValueError(f"Can only export to {' or '.join(EXPORT_FORMATS)} files")
+    count = 0
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == ".csv" else None
+        if writer: writer.writerow(STUDENT_FIELDS)
+        batch = []
+        for s in students:
+            batch.append([s.code, s.name, s.c1, s.c2, s.c3, s.cw_total, s.exam, s.overall, round(s.percent, 2), s.grade])
+            if len(batch) == CHUNK_SIZE:
+                count += _write_export_batch(f, writer, batch); batch = []
+        count += _write_export_batch(f, writer, batch)
+    os.replace(tmp, filename)
+    return count
+
+def _write_export_batch(f, writer, batch):
+    if writer:
+        writer.writerows(batch)
+    else:
+        f.write("".join(json.dumps(dict(zip(STUDENT_FIELDS, row))) + "\n" for row in batch))
+    return len(batch)
+
+def iter_stored_students(filename):
+    # Every stored student, one chunk in memory at a time. Unsaved journal
+    # edits can touch any row, so then the cohort is loaded in full instead.
+    with open_backend(filename) as backend:
+        if backend.read_journal():
+            yield from load_students(filename)
+            return
+        seen = set()  # the first row for a code wins, as in load_students
+        for chunk in backend.iter_chunks():
+            for fields in chunk:
+                if fields[0] not in seen:
+                    seen.add(fields[0])
+                    yield Student(*fields)
+
+def student_report(s):
+    return "\n".join([
+        f"Name: {s['name']}",
+        f"Student #: {s['code']}",
+        f"Coursework 1: {s['c1']}",
+        f"Coursework 2: {s['c2']}",
+        f"Coursework 3: {s['c3']}",
+        f"Coursework Total: {s['cw_total']} / 60",
+        f"Exam: {s['exam']} / 100",
+        f"Overall: {s['overall']} / 160",
+        f"Percentage: {s['percent']:.2f}%",
+        f"Grade: {s['grade']}"
+    ])
+
+def _report_name(code):
+    return re.sub(r"[^\w.-]", "_", code) + ".txt"
+
+def _write_reports(task):
+    # Runs in a worker process; the boundaries travel with the batch as in _scan_range
+    out_dir, rows, boundaries = task
+    set_grade_boundaries(boundaries)
+    for fields in rows:
+        with open(os.path.join(out_dir, _report_name(fields[0])), "w", encoding="utf-8") as f:
+            f.write(student_report(Student(*fields)) + "\n")
+    return len(rows)
+
+def write_reports(students, out_dir, workers=None):
+    # One text report per student in out_dir; returns how many were written
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    written, pending, batch = 0, [], []
+    with ProcessPoolExecutor(workers) as pool:
+        def submit(batch):
+            nonlocal written
+            pending.append(pool.submit(_write_reports, (out_dir, batch, GRADE_BOUNDARIES)))
+            while len(pending) > workers * 2:
+                written += pending.pop(0).result()
+        for s in students:
+            batch.append(s.fields())
+            if len(batch) == REPORT_BATCH:
+                submit(batch); batch = []
+        if batch: submit(batch)
+        for future in pending:
+            written += future.result()
+    return written
+
+# Change journal
+#
+# Edits are appended to <marks file>.journal as one line per operation:
+#   A,<student line>   add
+#   U,<student line>   update
+#   D,<code>           delete
+# load_students replays the journal over the marks file, and save_students
+# compacts both back into a single snapshot.
+
+class StudentJournal:
+    def __init__(self, filename=DATA_FILE):
+        self.path = filename + ".journal"
+        self.entries = 0
+
+    def append(self, ops):
+        # ops is a list of (op, fields) pairs; for deletes fields is just the code
+        lines = [f"D,{f}" if op == "D" else f"{op}," + ",".join(map(str, f)) for op, f in ops]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries += len(lines)
+        return len(data)
+
+    def read_lines(self):
+        # Raw byte lines; replay() decodes them and drops any torn last line
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            return f.read().splitlines(keepends=True)
+
+    def replay(self, students, stats=None, lines=None):
+        self.entries = 0
+        bad = 0
+        for raw in self.read_lines() if lines is None else lines:
+            try:
+                # a line without its newline was cut short by a crash mid-append
+                line = raw.decode("utf-8") if raw.endswith(b"\n") else ""
+            except UnicodeDecodeError:
+                line = ""
+            op, _, rest = line.strip().partition(",")
+            fields = parse_student_line(rest) if op in ("A", "U") else None
+            if op == "D" and rest:
+                record = students.get(rest.strip())
+                if record: students.remove(record)
+            elif fields:
+                record = students.get(fields[0])
+                if record: students.update(record, fields)
+                else: students.append(fields)
+            else:
+                bad += 1
+                continue
+            self.entries += 1
+        if stats is not None:
+            stats["malformed"] = stats.get("malformed", 0) + bad
+        return self.entries
+
+    def clear(self):
+        open(self.path, "w").close()
+        self.entries = 0
+
+# Storage backends
+#
+# Both backends offer the same operations to the app:
+#   iter_chunks(stats)       stream stored rows as lists of field tuples
+#   read_journal() / replay  edits not yet folded into the main store
+#   apply(ops)               persist a batch of ("A"|"U", fields) / ("D", code)
+#   write_snapshot(students) replace the stored rows (and their order)
+#   close()                  release the file; backends are also context managers
+# `journaled` tells the app whether apply() grows a journal that needs
+# compacting. The backend is picked from the file extension by open_backend().
+
+class TextBackend:
+    journaled = True
+
+    def __init__(self, filename=DATA_FILE):
+        self.filename = filename
+        self.journal = StudentJournal(filename)
+
+    def iter_chunks(self, stats=None):
+        if not os.path.exists(self.filename):
+            open(self.filename, "w").close()
+        return iter_student_chunks(self.filename, stats=stats)
+
+    def read_journal(self):
+        return self.journal.read_lines()
+
+    def replay(self, students, lines, stats=None):
+        return self.journal.replay(students, stats, lines)
+
+    def apply(self, ops):
+        return self.journal.append(ops)
+
+    def write_snapshot(self, students):
+        return write_snapshot(students, self.filename)
+
+    def close(self):
+        pass  # nothing is held open between calls
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Tail reading: after a load the app keeps where it stopped reading, and if
+    # another program has only appended to the file since, just the new bytes
+    # are parsed. A shrunken file, a different inode or changed bytes just
+    # before the old end all mean the file was rewritten.
+
+    def file_state(self, offset=None):
+        st = os.stat(self.filename)
+        offset = st.st_size if offset is None else offset
+        with open(self.filename, "rb") as f:
+            f.seek(max(0, offset - 64))
+            tail = f.read(min(64, offset))
+        return {"ino": st.st_ino, "mtime": st.st_mtime_ns, "size": st.st_size, "offset": offset, "tail": tail}
+
+    def has_changed(self, state):
+        st = os.stat(self.filename)
+        return (st.st_ino, st.st_mtime_ns, st.st_size) != (state["ino"], state["mtime"], state["size"])
+
+    def read_tail(self, state, stats=None):
+        # Returns (chunks, new_state), or None when a full reload is needed
+        current = self.file_state(state["offset"])
+        if current["ino"] != state["ino"] or current["size"] < state["offset"] or current["tail"] != state["tail"]:
+            return None
+        if current["size"] == state["offset"]:
+            # same length but touched: only safe to ignore if nothing was written
+            return ([], current) if current["mtime"] == state["mtime"] else None
+        if state["tail"][-1:] not in (b"", b"\n"):
+            # the last load read an unfinished line, which has since grown
+            return None
+        stats = {} if stats is None else stats
+        chunks = list(iter_student_chunks(self.filename, stats=stats, start=state["offset"], partial=False))
+        return chunks, self.file_state(stats["offset"])
+
+# Updates keep the row's rowid, and with it the student's place in the file order
+UPSERT_STUDENT = ("INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (code) DO UPDATE SET "
+                  "name = excluded.name, c1 = excluded.c1, c2 = excluded.c2, c3 = excluded.c3, "
+                  "exam = excluded.exam, overall = excluded.overall")
+
+class SQLiteBackend:
+    # Rows live in a single table keyed on code, with an index on overall
+    # (percent is overall / 160). Every edit is a single-row write.
+    journaled = False
+    SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+    def __init__(self, filename):
+        self.filename = filename
+        # all access is serialised through one I/O thread, so the connection may move between threads
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS students (
+                code TEXT PRIMARY KEY, name TEXT NOT NULL,
+                c1 INTEGER NOT NULL, c2 INTEGER NOT NULL, c3 INTEGER NOT NULL,
+                exam INTEGER NOT NULL, overall INTEGER NOT NULL);
+            -- name search runs on the in-memory store, so older files lose this index
+            DROP INDEX IF EXISTS students_name;
+            CREATE INDEX IF NOT EXISTS students_overall ON students (overall);
+        """)
+
+    @staticmethod
+    def _row(fields):
+        code, name, c1, c2, c3, exam = fields
+        return code, name, c1, c2, c3, exam, c1 + c2 + c3 + exam
+
+    def iter_chunks(self, stats=None, chunk_size=CHUNK_SIZE):
+        cur = self.db.execute("SELECT code, name, c1, c2, c3, exam FROM students ORDER BY rowid")
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk: return
+            if stats is not None:
+                stats["rows"] = stats.get("rows", 0) + len(chunk)
+            yield chunk
+
+    def read_journal(self):
+        return []
+
+    def replay(self, students, lines, stats=None):
+        return 0
+
+    def apply(self, ops):
+        with self.db:
+            for op, fields in ops:
+                if op == "D":
+                    self.db.execute("DELETE FROM students WHERE code = ?", (fields,))
+                else:
+                    self.db.execute(UPSERT_STUDENT, self._row(fields))
+
+    def write_snapshot(self, students):
+        with self.db:
+            self.db.execute("DELETE FROM students")
+            self.db.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (self._row(s.fields()) for s in students))
+
+    # Indexed queries, for callers that do not hold the whole cohort in memory
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+
+    def histogram(self):
+        # Students per overall mark (0-160), counted from the overall index
+        hist = [0] * 161
+        for overall, n in self.db.execute("SELECT overall, COUNT(*) FROM students GROUP BY overall"):
+            hist[overall] = n
+        return hist
+
+    def ranked(self, best=True, limit=10):
+        # Ties go to the earlier row, as in a scan of the file order
+        return [Student(*row) for row in self.db.execute(
+            "SELECT code, name, c1, c2, c3, exam FROM students "
+            f"ORDER BY overall {'DESC' if best else 'ASC'}, rowid LIMIT ?", (limit,))]
+
+    def highest(self):
+        found = self.ranked(True, 1)
+        return found[0] if found else None
+
+    def lowest(self):
+        found = self.ranked(False, 1)
+        return found[0] if found else None
+
+    # Conversion to and from the text format
+
+    def import_text(self, text_file, stats=None, replace=False):
+        # Rows from the file replace stored rows with the same code; within the
+        # file the first row for a code wins, as in load_students. With replace
+        # the table is emptied first. Returns (added, updated).
+        seen, before = set(), 0 if replace else self.count()
+        stats = {} if stats is None else stats
+        stats.setdefault("duplicates", 0)
+        with self.db:
+            if replace: self.db.execute("DELETE FROM students")
+            for chunk in iter_student_chunks(text_file, stats=stats):
+                rows = []
+                for fields in chunk:
+                    if fields[0] in seen: stats["duplicates"] += 1; continue
+                    seen.add(fields[0]); rows.append(self._row(fields))
+                self.db.executemany(UPSERT_STUDENT, rows)
+        added = self.count() - before
+        return added, len(seen) - added
+
+    def export_text(self, text_file):
+        # Returns the number of students written
+        write_snapshot((Student(*row) for chunk in self.iter_chunks() for row in chunk), text_file)
+        return self.count()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_backend(filename=DATA_FILE):
+    if filename.lower().endswith(SQLiteBackend.SUFFIXES):
+        return SQLiteBackend(filename)
+    return TextBackend(filename)
+
+# Lazy, memory-mapped access
+#
+# For read-mostly sessions the marks file is memory-mapped and only two arrays
+# are kept: offsets[i] is where the i-th valid record starts, and by_code holds
+# the same ordinals sorted by student code, so a code lookup is a binary search
+# that reads codes straight out of the map. Rows are parsed only when they are
+# displayed. Both arrays are cached in <marks file>.idx with the file's mtime
+# and size, so a warm start skips the scan entirely.
+
+INDEX_HEADER = struct.Struct("<6sqQQ")  # magic, mtime_ns, size, record count
+INDEX_MAGIC = b"SMIDX2"  # SMIDX1 indexes may point at lines that are not valid UTF-8
+
+class LazyStudentFile:
+    def __init__(self, filename=DATA_FILE):
+        self.filename = filename
+        self.index_path = filename + ".idx"
+        self._file = open(filename, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+        self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self.offsets = array("Q")
+        self.by_code = array("I")
+        self.from_cache = self._read_index()
+        if not self.from_cache:
+            self._build_index()
+            self._write_index()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def _line_at(self, offset):
+        end = self.map.find(b"\n", offset)
+        return self.map[offset:end if end != -1 else len(self.map)].decode("utf-8")
+
+    def code_at(self, i):
+        offset = self.offsets[i]
+        return self.map[offset:self.map.find(b",", offset)].decode("utf-8").strip()
+
+    def record(self, i):
+        return Student(*parse_student_line(self._line_at(self.offsets[i])))
+
+    def get(self, code):
+        i = bisect_left(self.by_code, code, key=self.code_at)
+        if i < len(self.by_code) and self.code_at(self.by_code[i]) == code:
+            return self.record(self.by_code[i])
+        return None
+
+    def _build_index(self):
+        # Same rules as iter_student_chunks: skip a class-size header, malformed
+        # or undecodable lines and repeated codes
+        codes, seen, pos, size = [], set(), 0, len(self.map)
+        while pos < size:
+            end = self.map.find(b"\n", pos)
+            end = size if end == -1 else end
+            line = decode_student_line(self.map[pos:end])
+            fields = parse_student_line(line) if line and not (pos == 0 and line.isdigit()) else None
+            if fields and fields[0] not in seen:
+                seen.add(fields[0])
+                self.offsets.append(pos)
+                codes.append(fields[0])
+            pos = end + 1
+        self.by_code = array("I", sorted(range(len(codes)), key=codes.__getitem__))
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, mtime_ns, size, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or (mtime_ns, size) != self._stamp:
+                    return False
+                self.offsets.fromfile(f, count)
+                self.by_code.fromfile(f, count)
+            return True
+        except (OSError, EOFError, struct.error):
+            self.offsets, self.by_code = array("Q"), array("I")
+            return False
+
+    def _write_index(self):
+        tmp = self.index_path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, *self._stamp, len(self.offsets)))
+                self.offsets.tofile(f)
+                self.by_code.tofile(f)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            pass  # the cache is only an optimisation
+
+    def close(self):
+        if self.map: self.map.close()
+        self._file.close()
+
+class LazyCodes:
+    # Read-only sequence of codes in file order, used as the table view in lazy mode
+    def __init__(self, lazy_file):
+        self.file = lazy_file
+
+    def __len__(self):
+        return len(self.file)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.file.code_at(i) for i in range(*index.indices(len(self.file)))]
+        return self.file.code_at(index)
+
+# Edit history
+#
+# Undo and redo keep an operation log rather than copies of the cohort. A step
+# is (label, changes, sort): changes is a list of (before, after) field tuples,
+# with None for a student that did not exist, so a single edit costs one pair
+# of tuples whatever the class size. Sort steps only record the (column,
+# descending) ordering before and after, as sorting never touches the store.
+
+class EditHistory:
+    def __init__(self, limit=UNDO_LIMIT):
+        self.limit = limit
+        self.undo_steps = []
+        self.redo_steps = []
+
+    def record(self, label, changes=None, sort=None):
+        self.undo_steps.append((label, changes, sort))
+        if len(self.undo_steps) > self.limit:
+            del self.undo_steps[0]
+        self.redo_steps.clear()
+
+    def undo(self):
+        # Returns the step with its changes and sort reversed, ready to apply
+        if not self.undo_steps: return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        label, changes, sort = step
+        return (label, changes and [(after, before) for before, after in reversed(changes)],
+                sort and sort[::-1])
+
+    def redo(self):
+        if not self.redo_steps: return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        return step
+
+    def clear(self):
+        self.undo_steps.clear(); self.redo_steps.clear()
+
+# Timing
+#
+# Opt-in wall-clock timings for loading, saving, filtering, sorting and table
+# rebuilds. Each entry is appended to TIMING_LOG as tab-separated
+#   time  operation  milliseconds  rows  bytes
+# for offline analysis. While disabled, start() returns None and stop() returns
+# straight away, so the instrumented code pays one attribute check.
+
+class OpTimer:
+    def __init__(self, log_file=TIMING_LOG, max_bytes=TIMING_LOG_BYTES):
+        self.enabled = False
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.last = None
+        self._lock = threading.Lock()  # saves are timed on the I/O thread
+
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, started, op, rows=0, nbytes=0):
+        if started is None:
+            return None
+        entry = (op, time.perf_counter() - started, rows, nbytes or 0)
+        self.last = entry
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{op}\t{entry[1] * 1000:.3f}\t{rows}\t{entry[3]}\n"
+        with self._lock:
+            try:
+                if os.path.exists(self.log_file) and os.path.getsize(self.log_file) > self.max_bytes:
+                    os.replace(self.log_file, self.log_file + ".1")
+                with open(self.log_file, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass  # timings are best effort and must never break the app
+        return entry
+
+    @staticmethod
+    def describe(entry):
+        op, seconds, rows, nbytes = entry
+        text = f"{op} {seconds * 1000:.1f} ms, {rows:,} rows"
+        return text + (f", {nbytes / 1024:,.1f} KB" if nbytes else "")
 
 # Tkinter App
 
 class StudentManager(tk.Tk):
-    def __init__(self):
+    def __init__(self, filename=DATA_FILE, lazy=False, timings=False):
         super().__init__()
         self.title("Student Manager")
         self.geometry("1000x650")
@@ -84,12 +1346,43 @@ class StudentManager(tk.Tk):
         self.style = ttk.Style(self)
         self._configure_style()
 
-        self.students = load_students()
+        self.students = StudentStore()
+        self.search_index = SearchIndex()
+        self.rank_index = MarkIndex()
+        self.sort_cache = SortCache()
+        self.queries = QueryEngine(self.students, self.rank_index)
+        self.data_file = filename
+        self.backend = open_backend(filename)
+        self._loader = None
+        self.lazy = None  # LazyStudentFile while browsing without a full load
+        self._search_job = None
+        # All file I/O runs on this single worker, in submission order
+        self._io = ThreadPoolExecutor(max_workers=1)
+        self._io_pending = []
+        self._pending_ops = []
+        self._save_job = None
+        self._journal_count = 0  # journal entries once queued writes land (text backend)
+        self._file_state = None  # where the last load stopped reading the file (text backend)
+        self._tail_pending = False
+        self._watch_job = None
+        self._dialogs = 0  # open modal dialogs; reloads wait until they are closed
+        self.watch_var = tk.BooleanVar(value=False)
+        self.timer = OpTimer()
+        self.history = EditHistory()
+        self.timer.enabled = timings
+        self.timings_var = tk.BooleanVar(value=timings)
+        self.view = []        # codes of the rows in the current filter/order
+        self.view_top = 0     # position in self.view of the first visible row
+        self._block = (0, 0)  # slice of self.view currently inserted in the tree
+        self._match = None    # predicate the current view was built from (None = all)
+        self.selected = set() # selected codes, including rows scrolled out of the tree
+        self._sort = None     # (column, descending) the view is ordered by; storage order is untouched
         self._create_menu()
         self._create_header()
         self._create_table()
         self._create_statusbar()
-        self._populate_table()
+        self._start_loading(lazy=lazy)
+        self.protocol("WM_DELETE_WINDOW", self.exit_app)
 
     def _configure_style(self):
         try:
@@ -116,21 +1409,43 @@ class StudentManager(tk.Tk):
         sort_sub.add_command(label="Sort by Overall (Ascending)", command=lambda: self.sort_records(True))
         sort_sub.add_command(label="Sort by Overall (Descending)", command=lambda: self.sort_records(False))
         filemenu.add_cascade(label="Sort Records", menu=sort_sub)
+        filemenu.add_command(label="Export View...", command=self.export_view)
+        filemenu.add_command(label="Write Student Reports...", command=self.export_reports)
+        filemenu.add_checkbutton(label="Watch File for Changes", variable=self.watch_var, command=self._toggle_watch)
+        filemenu.add_checkbutton(label="Record Timings", variable=self.timings_var,
+                                 command=lambda: setattr(self.timer, "enabled", self.timings_var.get()))
         filemenu.add_separator()
-        filemenu.add_command(label="Exit", command=self.quit)
+        filemenu.add_command(label="Exit", command=self.exit_app)
         menubar.add_cascade(label="File", menu=filemenu)
 
         # Edit Menu
         editmenu = tk.Menu(menubar, tearoff=0)
+        editmenu.add_command(label="Undo", command=self.undo, accelerator="Ctrl+Z")
+        editmenu.add_command(label="Redo", command=self.redo, accelerator="Ctrl+Y")
+        editmenu.add_separator()
         editmenu.add_command(label="Add Student", command=self.add_student)
         editmenu.add_command(label="Delete Student", command=self.delete_student)
         editmenu.add_command(label="Update Student", command=self.update_student)
+        editmenu.add_separator()
+        editmenu.add_command(label="Select All in View", command=self.select_all, accelerator="Ctrl+A")
+        editmenu.add_command(label="Delete Selected...", command=self.bulk_delete, accelerator="Del")
+        editmenu.add_command(label="Adjust Marks for Selected...", command=self.bulk_adjust)
         menubar.add_cascade(label="Edit", menu=editmenu)
 
         # Stats Menu
         statsmenu = tk.Menu(menubar, tearoff=0)
         statsmenu.add_command(label="Show Highest Overall", command=self.show_highest)
         statsmenu.add_command(label="Show Lowest Overall", command=self.show_lowest)
+        statsmenu.add_separator()
+        statsmenu.add_command(label="Show Top N...", command=lambda: self.show_ranked(True))
+        statsmenu.add_command(label="Show Bottom N...", command=lambda: self.show_ranked(False))
+        statsmenu.add_command(label="Student Rank & Percentile...", command=self.show_rank)
+        statsmenu.add_separator()
+        statsmenu.add_command(label="Query Students...", command=self.query_students)
+        statsmenu.add_command(label="Failed Exam List", command=self.show_failed_exam)
+        statsmenu.add_separator()
+        statsmenu.add_command(label="Cohort Statistics", command=self.show_statistics)
+        statsmenu.add_command(label="Grade Boundaries...", command=self.edit_grade_boundaries)
         menubar.add_cascade(label="Stats", menu=statsmenu)
 
         # Help Menu
@@ -140,6 +1455,8 @@ class StudentManager(tk.Tk):
         menubar.add_cascade(label="Help", menu=helpmenu)
 
         self.config(menu=menubar)
+        self.bind("<Control-z>", lambda e: self.undo())
+        self.bind("<Control-y>", lambda e: self.redo())
 
     def _create_header(self):
         header_frame = ttk.Frame(self, padding=(14,12,14,6))
@@ -152,6 +1469,7 @@ class StudentManager(tk.Tk):
         ent = ttk.Entry(search_frame, textvariable=self.search_var)
         ent.pack(side=tk.LEFT, ipadx=10, ipady=2)
         ent.bind("<Return>", lambda e: self.filter_table())
+        self.search_var.trace_add("write", self._schedule_filter)
         ttk.Button(search_frame, text="Search", command=self.filter_table, style="Accent.TButton").pack(side=tk.LEFT, padx=(6,0))
         ttk.Button(search_frame, text="Clear", command=self.clear_filter).pack(side=tk.LEFT, padx=(6,0))
 
@@ -160,48 +1478,511 @@ class StudentManager(tk.Tk):
         container.pack(fill=tk.BOTH, expand=True)
 
         columns = ("code","name","c1","c2","c3","cw_total","exam","percent","grade")
-        self.tree = ttk.Treeview(container, columns=columns, show="headings", selectmode="browse")
-        self.tree.heading("code", text="Student #"); self.tree.column("code", width=90, anchor=tk.CENTER)
-        self.tree.heading("name", text="Name"); self.tree.column("name", width=300, anchor=tk.W)
+        self.tree = ttk.Treeview(container, columns=columns, show="headings", selectmode="extended")
+        self.headings = {"code": "Student #", "name": "Name"}
+        self.tree.column("code", width=90, anchor=tk.CENTER)
+        self.tree.column("name", width=300, anchor=tk.W)
         for col,width in [("c1",55),("c2",55),("c3",55),("cw_total",80),("exam",70),("percent",80),("grade",60)]:
-            self.tree.heading(col, text=col.capitalize())
+            self.headings[col] = col.capitalize()
             self.tree.column(col, width=width, anchor=tk.CENTER)
+        for col, text in self.headings.items():
+            self.tree.heading(col, text=text, command=lambda c=col: self.sort_by(c))
 
-        vsb = ttk.Scrollbar(container, orient="vertical", command=self.tree.yview)
+        # The tree only ever holds the visible rows plus TABLE_OVERSCAN either side;
+        # the vertical scrollbar is driven from self.view instead of the tree.
+        self.vsb = ttk.Scrollbar(container, orient="vertical", command=self._on_vscroll)
         hsb = ttk.Scrollbar(container, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-        self.tree.grid(row=0,column=0,sticky="nsew"); vsb.grid(row=0,column=1,sticky="ns"); hsb.grid(row=1,column=0,sticky="ew")
+        self.tree.configure(yscrollcommand=self._on_tree_yscroll, xscrollcommand=hsb.set)
+        self.tree.grid(row=0,column=0,sticky="nsew"); self.vsb.grid(row=0,column=1,sticky="ns"); hsb.grid(row=1,column=0,sticky="ew")
         container.rowconfigure(0, weight=1); container.columnconfigure(0, weight=1)
         self.tree.bind("<Double-1>", self.on_row_double_click)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Control-a>", lambda e: self.select_all() or "break")
+        self.tree.bind("<Delete>", lambda e: self.bulk_delete())
+        self.tree.bind("<Configure>", lambda e: self._render())
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", self._on_mousewheel)
+        self.tree.bind("<Button-5>", self._on_mousewheel)
 
     def _create_statusbar(self):
         bar = ttk.Frame(self, relief=tk.FLAT)
         bar.pack(side=tk.BOTTOM, fill=tk.X)
         self.status_var = tk.StringVar(value=f"Loaded {len(self.students)} students")
-        ttk.Label(bar, textvariable=self.status_var, anchor=tk.W, padding=6).pack(fill=tk.X)
+        self.progress = ttk.Progressbar(bar, length=160, maximum=100)
+        ttk.Label(bar, textvariable=self.status_var, anchor=tk.W, padding=6).pack(side=tk.LEFT, fill=tk.X, expand=True)
 
    
+    # Loading
+
+    def _start_loading(self, lazy=False):
+        # The file is parsed on the I/O worker and handed over a chunk at a time,
+        # so the first page shows straight away and the window stays responsive.
+        # With lazy=True only the offset index is built (or read from its cache).
+        self._cancel_loading()
+        self._flush_saves()
+        if self.lazy is not None:
+            self.lazy.close(); self.lazy = None
+        self._file_state = None
+        self._load_started = self.timer.start()
+        self.history.clear()
+        self.students = StudentStore()
+        self.search_index = self.students.attach(SearchIndex())
+        self.rank_index = self.students.attach(MarkIndex())
+        self.sort_cache = self.students.attach(SortCache())
+        self.queries = QueryEngine(self.students, self.rank_index)
+        self._populate_table([])
+        self._load_stats = {"duplicates": 0, "malformed": 0}
+        self._load_size = os.path.getsize(self.data_file) if os.path.exists(self.data_file) else 0
+        self._load_cancel = threading.Event()
+        self._loader = queue.Queue(maxsize=8)
+        self._io.submit(self._load_worker, self.backend, self._load_stats, self._loader, self._load_cancel, lazy)
+        self.status_var.set("Loading students...")
+        self._show_progress("determinate")
+        self.after(10, self._load_next_chunk)
+
+    def _load_worker(self, backend, stats, out, cancel, lazy=False):
+        # Runs on the I/O thread: only touches the queue, never Tk
+        def put(item):
+            while not cancel.is_set():
+                try: out.put(item, timeout=0.1); return
+                except queue.Full: pass
+        try:
+            chunks = backend.iter_chunks(stats=stats)
+            journal = backend.read_journal()
+            # unsaved journal entries are not in the mapped file, so they need a full load
+            if lazy and isinstance(backend, TextBackend) and not journal:
+                put(("lazy", LazyStudentFile(backend.filename), backend.file_state()))
+                return
+            for chunk in chunks:
+                put(chunk)
+            state = backend.file_state(stats["offset"]) if isinstance(backend, TextBackend) else None
+            put(("journal", journal, state))
+        except Exception as exc:
+            put(exc)
+
+    def _cancel_loading(self):
+        if self._loader is not None:
+            self._load_cancel.set()
+            self._loader = None
+
+    def _load_next_chunk(self):
+        if self._loader is None:
+            return
+        try:
+            item = self._loader.get_nowait()
+        except queue.Empty:
+            self.after(20, self._load_next_chunk)
+            return
+        if isinstance(item, Exception):
+            self._loader = None
+            self._hide_progress()
+            messagebox.showerror("Load Error", f"Could not read {self.data_file}:\n{item}")
+            return
+        if isinstance(item, tuple) and item[0] == "lazy":
+            self._loader = None
+            self._hide_progress()
+            self.lazy = self.students = item[1]
+            self._file_state = item[2]
+            self._populate_table()
+            source = "cached index" if self.lazy.from_cache else "new index"
+            self.status_var.set(f"Opened {len(self.lazy)} students read-only ({source}); editing or searching loads everything")
+            self._show_timing(self.timer.stop(self._load_started, "open lazy", len(self.lazy), self._load_size))
+            return
+        if isinstance(item, tuple):
+            self._loader = None
+            self._hide_progress()
+            self._file_state = item[2]
+            self._journal_count = self.backend.replay(self.students, item[1], self._load_stats)
+            if self._journal_count:
+                self._refresh_view()
+            msg = f"Loaded {len(self.students)} students"
+            skipped = [f"{self._load_stats[k]} {k}" for k in ("malformed", "duplicates") if self._load_stats[k]]
+            if skipped:
+                msg += f" (skipped {', '.join(skipped)} lines)"
+            if self._sort is not None:
+                self._show_codes(self.view, self._match)
+            self.status_var.set(msg)
+            self._show_timing(self.timer.stop(self._load_started, "load", len(self.students), self._load_stats.get("offset", 0)))
+            return
+        start = self.students.row_count
+        self._load_stats["duplicates"] += self.students.extend(item)
+        self.view.extend(s.code for s in self.students.iter_rows(start) if self._matches(s))
+        self._render()
+        if self._load_size:
+            self.progress["value"] = min(100, 100 * self._load_stats.get("offset", 0) / self._load_size)
+        self.status_var.set(f"Loading students... {len(self.students)} so far")
+        self.after(1, self._load_next_chunk)
+
+    # Saving
+
+    def _persist(self, ops):
+        # Queues the edits; a burst of edits within SAVE_DELAY_MS becomes one journal write.
+        # Records are views onto the live store, so their fields are captured now.
+        self._pending_ops.extend((op, s if op == "D" else s.fields()) for op, s in ops)
+        if self._save_job is None:
+            self._save_job = self.after(SAVE_DELAY_MS, self._flush_saves)
+
+    def _flush_saves(self, compact=True):
+        # compact is False when called from _compact, which queues its own snapshot
+        if self._save_job is not None:
+            self.after_cancel(self._save_job)
+            self._save_job = None
+        if not self._pending_ops:
+            return
+        ops, self._pending_ops = self._pending_ops, []
+        self._submit_io(self._apply_ops, self.backend, ops, then=self._show_timing)
+        if not self.backend.journaled:
+            return
+        self._journal_count += len(ops)
+        if compact and self._journal_count >= COMPACT_AFTER:
+            self._compact()
+
+    def _compact(self):
+        self._flush_saves(compact=False)
+        self._submit_io(self._write_snapshot, self.backend, self.students.copy(), then=self._set_file_state)
+        self._journal_count = 0
+
+    def _apply_ops(self, backend, ops):
+        # Runs on the I/O thread, like every function handed to _submit_io
+        started = self.timer.start()
+        return self.timer.stop(started, "save", len(ops), backend.apply(ops))
+
+    def _write_snapshot(self, backend, students):
+        # Runs on the I/O thread; the rewritten file becomes the new tail baseline
+        started = self.timer.start()
+        entry = self.timer.stop(started, "snapshot", len(students), backend.write_snapshot(students))
+        return backend.file_state() if isinstance(backend, TextBackend) else None, entry
+
+    def _set_file_state(self, result):
+        self._file_state, entry = result
+        self._show_timing(entry)
+
+    def _show_timing(self, entry):
+        # Adds the latest timing to the status message (entry is None while disabled)
+        if entry is not None:
+            self.status_var.set(self.status_var.get().split(TIMING_SEP)[0] + TIMING_SEP + OpTimer.describe(entry))
+
+    def _submit_io(self, fn, *args, then=None, error=None):
+        # then(result) is called on the Tk thread once fn has finished without error;
+        # error is the (title, file) shown if it fails, by default a save of the data file
+        self._io_pending.append((self._io.submit(fn, *args), then, error or ("Save Error", self.data_file)))
+        if len(self._io_pending) == 1:
+            self._show_progress("indeterminate")
+            self.after(50, self._poll_io)
+
+    def _poll_io(self):
+        # Reports finished writes back on the Tk thread
+        while self._io_pending and self._io_pending[0][0].done():
+            future, then, (title, target) = self._io_pending.pop(0)
+            exc = future.exception()
+            if exc is not None:
+                messagebox.showerror(title, f"Could not write to {target}:\n{exc}")
+            elif then is not None:
+                then(future.result())
+        if self._io_pending:
+            self.after(50, self._poll_io)
+        elif self._loader is None:
+            self._hide_progress()
+
+    def _show_progress(self, mode):
+        self.progress.configure(mode=mode, value=0)
+        self.progress.pack(side=tk.RIGHT, padx=8)
+        if mode == "indeterminate": self.progress.start(15)
+
+    def _hide_progress(self):
+        self.progress.stop()
+        self.progress.pack_forget()
+
+    def exit_app(self):
+        # A half-loaded store must never be written back over the file
+        if self._watch_job is not None:
+            self.after_cancel(self._watch_job)
+        if self._loader is not None:
+            self._cancel_loading()
+        elif self._journal_count:
+            self._compact()
+        else:
+            self._flush_saves()
+        self._io.shutdown(wait=True)
+        self.backend.close()
+        self.destroy()
+
+    def _needs_full_store(self):
+        # Lazy mode only supports browsing; anything else switches to a full load
+        if self.lazy is not None:
+            messagebox.showinfo("Loading", "Loading all student records. Please try again once loading finishes.")
+            self._start_loading()
+            return True
+        return False
+
+    def _is_loading(self):
+        if self._needs_full_store():
+            return True
+        if self._loader is not None:
+            messagebox.showinfo("Please wait", "Student records are still loading.")
+            return True
+        return False
+
     # Table functions
     
-    def _populate_table(self, students=None):
-        for r in self.tree.get_children(): self.tree.delete(r)
-        src = students if students else self.students
-        for s in src:
-            self.tree.insert("", tk.END, iid=s["code"], values=(
-                s["code"],s["name"],s["c1"],s["c2"],s["c3"],s["cw_total"],s["exam"],f"{s['percent']:.2f}",s["grade"]
-            ))
-        self.status_var.set(f"Displayed {len(src)} students")
+    def _row_values(self, s):
+        return (s["code"],s["name"],s["c1"],s["c2"],s["c3"],s["cw_total"],s["exam"],f"{s['percent']:.2f}",s["grade"])
+
+    def _populate_table(self, students=None, match=None):
+        started = self.timer.start()
+        if students is None:
+            codes = LazyCodes(self.lazy) if self.lazy is not None else self.students.live_codes()
+        else:
+            codes = [s["code"] for s in students]
+        self._show_codes(codes, match)
+        self._show_timing(self.timer.stop(started, "table", len(codes)))
+
+    def _show_codes(self, codes, match=None):
+        # match describes which students belong in the view, so later edits can be diffed in
+        if self._sort is not None and not isinstance(codes, LazyCodes):
+            codes = self._sorted(codes)
+        self.view = codes
+        self._match = match
+        self.selected = set()
+        self.view_top = 0
+        self._render(force=True)
+        self.status_var.set(f"Displayed {len(self.view)} students")
+
+    def _refresh_view(self):
+        # Rebuilds the current view from the store, keeping the filter and scroll position
+        top = self.view_top
+        self._populate_table(None if self._match is None else [s for s in self.students if self._match(s)], self._match)
+        self.view_top = top
+        self._render()
+
+    def _matches(self, s):
+        return self._match is None or self._match(s)
+
+    # Incremental table updates: each edit touches at most one tree row
+
+    def _view_position(self, code):
+        start, end = self._block
+        if self.tree.exists(code):
+            return start + self.tree.index(code)
+        try:
+            return self.view.index(code)
+        except ValueError:
+            return None
+
+    def _table_added(self, s):
+        if not self._matches(s): return
+        start, end = self._block
+        pos = len(self.view) if self._sort is None else self._sort_position(s)
+        self.view.insert(pos, s["code"])
+        if pos < start:
+            # keep the same rows on screen
+            self._block = (start + 1, end + 1)
+            self.view_top += 1
+        elif pos <= end:
+            self.tree.insert("", pos - start, iid=s["code"], values=self._row_values(s))
+            self._block = (start, end + 1)
+        self._update_vsb()
+
+    def _view_key(self):
+        # Sort key for a code in the view. Equal keys keep storage order, and a
+        # descending view is the ascending one reversed, as with SortCache orders.
+        get, sort_key = self.students.get, SortCache.sort_key(self._sort[0])
+        def key(code):
+            record = get(code)
+            return sort_key(record), record.row
+        return key
+
+    def _sort_position(self, s):
+        # Where s goes in the sorted view; s must not be in the view already
+        view_key = self._view_key()
+        k = view_key(s["code"])
+        if self._sort[1]:
+            return bisect_left(self.view, True, key=lambda c: view_key(c) < k)
+        return bisect_left(self.view, k, key=view_key)
+
+    def _table_updated(self, s):
+        code = s["code"]
+        pos = self._view_position(code)
+        if pos is None:
+            self._table_added(s)
+        elif not self._matches(s):
+            self._table_removed(code)
+        elif self._sort is not None:
+            # new marks can move the row, so it is taken out and put back in order
+            selected = code in self.selected
+            self._table_removed(code)
+            self._table_added(s)
+            if selected:
+                self.selected.add(code)
+                if self.tree.exists(code): self.tree.selection_add(code)
+        elif self.tree.exists(code):
+            self.tree.item(code, values=self._row_values(s))
+
+    def _table_removed(self, code):
+        self.selected.discard(code)
+        pos = self._view_position(code)
+        if pos is None: return
+        del self.view[pos]
+        start, end = self._block
+        if pos < start:
+            # keep the same rows on screen
+            self._block = (start - 1, end - 1)
+            self.view_top = max(0, self.view_top - 1)
+        elif pos < end:
+            self.tree.delete(code)
+            self._block = (start, end - 1)
+        self._render()
+
+    def _visible_rows(self):
+        rowheight = int(self.style.lookup("Treeview", "rowheight") or 28)
+        # one row's worth of height goes to the headings
+        return max(1, self.tree.winfo_height() // rowheight - 1)
+
+    def _render(self, force=False):
+        n, visible = len(self.view), self._visible_rows()
+        self.view_top = top = max(0, min(self.view_top, n - visible))
+        start, end = self._block
+        margin = TABLE_OVERSCAN // 2
+        if force or (start > 0 and top < start + margin) or (end < n and top + visible > end - margin) \
+                or top < start or min(n, top + visible) > end:
+            self.tree.delete(*self.tree.get_children())
+            start, end = max(0, top - TABLE_OVERSCAN), min(n, top + visible + TABLE_OVERSCAN)
+            for code in self.view[start:end]:
+                self.tree.insert("", tk.END, iid=code, values=self._row_values(self.students.get(code)))
+            self._block = (start, end)
+            keep = [c for c in self.view[start:end] if c in self.selected]
+            if keep: self.tree.selection_set(keep)
+        if end > start:
+            self.tree.yview_moveto((top - start) / (end - start))
+        self._update_vsb()
+
+    def _on_select(self, event=None):
+        # The tree only knows about the rendered block; selections elsewhere are kept
+        start, end = self._block
+        self.selected.difference_update(self.view[start:end])
+        self.selected.update(self.tree.selection())
+
+    def _update_vsb(self):
+        n = len(self.view)
+        if n: self.vsb.set(self.view_top / n, min(1.0, (self.view_top + self._visible_rows()) / n))
+        else: self.vsb.set(0.0, 1.0)
+
+    def _scroll_to(self, top):
+        self.view_top = int(top)
+        self._render()
+
+    def _on_vscroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * len(self.view))
+        elif unit == "pages":
+            self._scroll_to(self.view_top + int(amount) * self._visible_rows())
+        else:
+            self._scroll_to(self.view_top + int(amount))
+
+    def _on_mousewheel(self, event):
+        if event.num == 4: step = -3
+        elif event.num == 5: step = 3
+        else: step = -3 if event.delta > 0 else 3
+        self._scroll_to(self.view_top + step)
+        return "break"
+
+    def _on_tree_yscroll(self, first, last):
+        # The tree scrolled itself inside the rendered block (e.g. keyboard navigation)
+        start, end = self._block
+        top = start + round(float(first) * (end - start))
+        if top != self.view_top:
+            self.view_top = top
+            self._update_vsb()
+            self.after_idle(self._render)
 
     def view_all(self):
-        self.students = load_students()
-        self._populate_table()
-        self.status_var.set(f"Displayed {len(self.students)} students")
+        self.search_var.set("")
+        self._reload()
+
+    # Reloading
+
+    def _reload(self):
+        # When another program has only appended to the file since it was loaded,
+        # just the new lines are parsed and merged; anything else is a full reload.
+        if self._tail_pending or self._dialogs:
+            return  # the watcher tries again once the dialog is closed
+        if self._loader is not None or self.lazy is not None or self._file_state is None:
+            self._start_loading(lazy=self.lazy is not None)
+            return
+        if self._io_pending:
+            # let queued writes land first so the baseline includes them
+            self.after(50, self._reload)
+            return
+        self._tail_pending = True
+        self.status_var.set("Checking for new students...")
+        self._submit_io(self._tail_worker, self.backend, self._file_state, then=self._tail_loaded)
+
+    def _tail_worker(self, backend, state):
+        # Runs on the I/O thread: only reads the file, never Tk
+        stats = {"rows": 0, "malformed": 0}
+        try:
+            return backend.read_tail(state, stats), stats
+        except Exception as exc:
+            return exc, stats
+
+    def _tail_loaded(self, result):
+        self._tail_pending = False
+        tail, stats = result
+        if isinstance(tail, Exception):
+            messagebox.showerror("Load Error", f"Could not read {self.data_file}:\n{tail}")
+            return
+        if tail is None:
+            self._start_loading()
+            return
+        chunks, self._file_state = tail
+        start = self.students.row_count
+        duplicates = sum(self.students.extend(chunk) for chunk in chunks)
+        self.view.extend(s.code for s in self.students.iter_rows(start) if self._matches(s))
+        if self._sort is not None and self.students.row_count > start:
+            self.view = self._sorted(self.view)
+            self._render(force=True)
+        else:
+            self._render()
+        msg = f"{self.students.row_count - start} new students read ({len(self.students)} total)"
+        skipped = [f"{n} {k}" for k, n in (("malformed", stats["malformed"]), ("duplicates", duplicates)) if n]
+        if skipped:
+            msg += f" (skipped {', '.join(skipped)} lines)"
+        self.status_var.set(msg)
+
+    def _toggle_watch(self):
+        if self._watch_job is not None:
+            self.after_cancel(self._watch_job)
+            self._watch_job = None
+        if self.watch_var.get():
+            self._watch_job = self.after(WATCH_INTERVAL_MS, self._watch_file)
+
+    def _watch_file(self):
+        # Polls size and mtime only; the file is read when one of them moves
+        self._watch_job = self.after(WATCH_INTERVAL_MS, self._watch_file)
+        if self._loader is not None or self._tail_pending or self._io_pending or self._file_state is None:
+            return
+        try:
+            changed = self.backend.has_changed(self._file_state)
+        except OSError:
+            return
+        if changed:
+            self._reload()
+
+    def _schedule_filter(self, *args):
+        # Filters as the user types, once they pause for SEARCH_DELAY_MS
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self.filter_table)
 
     def filter_table(self):
+        self._search_job = None
         q = self.search_var.get().strip().lower()
         if not q: self._populate_table(); return
-        filtered = [s for s in self.students if q in s["name"].lower() or q==s["code"].lower()]
-        self._populate_table(filtered)
+        if self._needs_full_store(): return
+        match = lambda s: q in s["name"].lower() or s["code"].lower().startswith(q)
+        started = self.timer.start()
+        self._show_codes(self.search_index.search(q, self.students), match)
+        self._show_timing(self.timer.stop(started, "filter", len(self.view)))
 
     def clear_filter(self):
         self.search_var.set("")
@@ -211,23 +1992,11 @@ class StudentManager(tk.Tk):
         sel = self.tree.selection()
         if sel:
             code = sel[0]
-            student = next((s for s in self.students if s["code"]==code), None)
+            student = self.students.get(code)
             if student: self._show_student_detail(student)
 
     def _show_student_detail(self, s):
-        lines = [
-            f"Name: {s['name']}",
-            f"Student #: {s['code']}",
-            f"Coursework 1: {s['c1']}",
-            f"Coursework 2: {s['c2']}",
-            f"Coursework 3: {s['c3']}",
-            f"Coursework Total: {s['cw_total']} / 60",
-            f"Exam: {s['exam']} / 100",
-            f"Overall: {s['overall']} / 160",
-            f"Percentage: {s['percent']:.2f}%",
-            f"Grade: {s['grade']}"
-        ]
-        messagebox.showinfo("Student Detail", "\n".join(lines))
+        messagebox.showinfo("Student Detail", student_report(s))
 
    
     # Individual student 
@@ -236,12 +2005,12 @@ class StudentManager(tk.Tk):
         code = simpledialog.askstring("Individual Student", "Enter Student Number:")
         if not code:
             return
-        student = next((s for s in self.students if s["code"] == code.strip()), None)
+        student = self.students.get(code.strip())
         if not student:
             messagebox.showinfo("Not found", "Student not found.")
             return
         # Populate table with only this student
-        self._populate_table([student])
+        self._populate_table([student], lambda s, code=student["code"]: s["code"] == code)
         self.status_var.set(f"Showing individual student: {student['code']} - {student['name']}")
 
     
@@ -251,23 +2020,40 @@ class StudentManager(tk.Tk):
         self._student_form("Add Student")
 
     def update_student(self, code_or_none=None):
-        self._student_form("Update Student", code_or_none)
+        code = code_or_none or simpledialog.askstring("Update Student", "Enter student number to update:")
+        if not code: return
+        if code.strip() not in self.students: messagebox.showinfo("Not found", "Student not found."); return
+        self._student_form("Update Student", code.strip())
 
     def delete_student(self, code_or_none=None):
+        if self._is_loading(): return
         code = code_or_none or simpledialog.askstring("Delete Student", "Enter student number to delete:")
         if not code: return
-        student = next((s for s in self.students if s["code"]==code.strip()), None)
+        student = self.students.get(code.strip())
         if not student: messagebox.showinfo("Not found", "Student not found."); return
         if not messagebox.askyesno("Confirm Delete", f"Delete {student['code']} - {student['name']}?"): return
-        self.students = [s for s in self.students if s["code"]!=student["code"]]
-        save_students(self.students)
-        self._populate_table()
-        self.status_var.set(f"Deleted student {student['code']}")
+        code = student["code"]
+        self.history.record(f"delete {code}", [(student.fields(), None)])
+        self.students.remove(student)
+        self._persist([("D", code)])
+        self._table_removed(code)
+        self.status_var.set(f"Deleted student {code}")
 
-    def _student_form(self, title, code_or_none=None):
-        student = next((s for s in self.students if s["code"]==code_or_none), None) if code_or_none else None
+    def _dialog(self, title):
+        # A modal window. grab_set does not hold back after() callbacks, so the
+        # file watcher is paused while it is open rather than swapping the store
         win = tk.Toplevel(self)
         win.title(title); win.transient(self); win.grab_set()
+        self._dialogs += 1
+        def closed(event):
+            if event.widget is win: self._dialogs -= 1
+        win.bind("<Destroy>", closed)
+        return win
+
+    def _student_form(self, title, code_or_none=None):
+        if self._is_loading(): return
+        student = self.students.get(code_or_none) if code_or_none else None
+        win = self._dialog(title)
         frm = ttk.Frame(win, padding=12); frm.pack(fill=tk.BOTH, expand=True)
         entries = {}
         fields = [("code","Student Code"),("name","Name"),("c1","Coursework 1"),("c2","Coursework 2"),
@@ -285,52 +2071,632 @@ class StudentManager(tk.Tk):
             code = entries["code"].get().strip(); name = entries["name"].get().strip()
             try: c1=int(entries["c1"].get()); c2=int(entries["c2"].get()); c3=int(entries["c3"].get()); exam=int(entries["exam"].get())
             except ValueError: messagebox.showerror("Invalid","Marks must be integers."); return
+            if not code: messagebox.showerror("Invalid","Student code required"); return
             if not name: messagebox.showerror("Invalid","Name required"); return
+            if "," in name or "," in code: messagebox.showerror("Invalid","Commas are not allowed"); return
             if not all(0<=m<=20 for m in (c1,c2,c3)) or not 0<=exam<=100:
                 messagebox.showerror("Invalid","Marks out of range"); return
-            cw_total=c1+c2+c3; overall=cw_total+exam; percent=(overall/160)*100; grade=calculate_grade(percent)
-            data={"code":code,"name":name,"c1":c1,"c2":c2,"c3":c3,"cw_total":cw_total,"exam":exam,
-                  "overall":overall,"percent":percent,"grade":grade}
-            if student: self.students[self.students.index(student)] = data
-            else: self.students.append(data)
-            save_students(self.students); self._populate_table(); win.destroy()
+            data=(code,name,c1,c2,c3,exam)
+            if self._is_loading(): return
+            # records are looked up again in case the store changed while the form was open
+            student = self.students.get(code_or_none) if code_or_none else None
+            if code_or_none and not student:
+                messagebox.showerror("Invalid",f"Student code {code_or_none} no longer exists"); win.destroy(); return
+            if not student and code in self.students:
+                messagebox.showerror("Invalid",f"Student code {code} already exists"); return
+            if student:
+                self.history.record(f"update {code}", [(student.fields(), data)])
+                self.students.update(student, data); self._table_updated(student)
+                self._persist([("U", student)])
+            else:
+                self.history.record(f"add {code}", [(None, data)])
+                record = self.students.append(data); self._table_added(record)
+                self._persist([("A", record)])
+            win.destroy()
             self.status_var.set(f"{title} completed: {code}")
 
         ttk.Button(frm,text="Submit",command=submit,style="Accent.TButton").grid(row=len(fields),column=0,columnspan=2,pady=(8,6))
 
+    # Export
+
+    def _view_snapshot(self):
+        # A copy of the store plus the view's codes, safe to read on the I/O thread
+        students = self.students.copy()
+        codes = list(self.view)
+        return (students.get(c) for c in codes), len(codes)
+
+    def export_view(self):
+        if self._is_loading(): return
+        filename = filedialog.asksaveasfilename(title="Export View", defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not filename: return
+        if export_format(filename) is None:
+            messagebox.showerror("Export", "Choose a .csv or .jsonl file name."); return
+        rows, count = self._view_snapshot()
+        self.status_var.set(f"Exporting {count} students...")
+        self._submit_io(export_students, rows, filename, error=("Export Error", filename),
+                        then=lambda n: self.status_var.set(f"Exported {n} students to {os.path.basename(filename)}"))
+
+    def export_reports(self):
+        if self._is_loading(): return
+        out_dir = filedialog.askdirectory(title="Folder for Student Reports")
+        if not out_dir: return
+        rows, count = self._view_snapshot()
+        self.status_var.set(f"Writing {count} student reports...")
+        self._submit_io(write_reports, rows, out_dir, error=("Report Error", out_dir),
+                        then=lambda n: self.status_var.set(f"Wrote {n} student reports to {out_dir}"))
+
+    # Undo / redo
+
+    def undo(self):
+        self._replay_step(self.history.undo(), "Undid")
+
+    def redo(self):
+        self._replay_step(self.history.redo(), "Redid")
+
+    def _replay_step(self, step, verb):
+        if self._loader is not None or self.lazy is not None: return
+        if step is None:
+            self.status_var.set("Nothing to undo" if verb == "Undid" else "Nothing to redo"); return
+        label, changes, sort = step
+        if sort is not None:
+            self._set_sort(sort[1])
+        else:
+            self._apply_changes(changes)
+        self.status_var.set(f"{verb} {label}")
+
+    def _apply_changes(self, changes):
+        # Goes through the same store, save and table paths as a normal edit
+        diff = len(changes) <= TABLE_DIFF_LIMIT
+        for before, after in changes:
+            code = (before or after)[0]
+            record = self.students.get(code)
+            if after is None:
+                if not record: continue
+                self.students.remove(record)
+                self._persist([("D", code)])
+                if diff: self._table_removed(code)
+            elif record:
+                self.students.update(record, after)
+                self._persist([("U", record)])
+                if diff: self._table_updated(record)
+            else:
+                record = self.students.append(after)
+                self._persist([("A", record)])
+                if diff: self._table_added(record)
+        if not diff:
+            self._refresh_view()
+
+    # Bulk edits
+    #
+    # A bulk action works on the selected rows, or on the whole filtered view
+    # when nothing is selected. It is checked up front, applied to the store in
+    # one pass, saved as a single batch and redrawn once.
+
+    def select_all(self):
+        if self.lazy is not None: return
+        self.selected = set(self.view)
+        self._render(force=True)
+        self.status_var.set(f"Selected {len(self.selected)} students")
+
+    def _bulk_targets(self, action):
+        if self._is_loading(): return []
+        if self.selected:
+            codes = [c for c in self.view if c in self.selected]
+        elif self._match is not None and self.view:
+            if not messagebox.askyesno(action, f"No rows are selected. {action} all {len(self.view)} students in the current view?"):
+                return []
+            codes = list(self.view)
+        else:
+            messagebox.showinfo(action, "Select students first (Ctrl/Shift-click or Ctrl+A), or search to narrow the list.")
+            return []
+        return [r for r in map(self.students.get, codes) if r]
+
+    def _table_replaced(self, keep, resort=False):
+        # One redraw after a bulk change; keep(code) says which rows stay in the
+        # view, and resort puts a sorted view back in order after marks changed
+        top = self.view_top
+        self.view = [c for c in self.view if keep(c)]
+        if resort and self._sort is not None:
+            self.view = self._sorted(self.view)
+        self.selected.intersection_update(self.view)
+        self.view_top = top
+        self._render(force=True)
+
+    def bulk_delete(self):
+        targets = self._bulk_targets("Delete")
+        if not targets: return
+        if not messagebox.askyesno("Confirm Delete", f"Delete {len(targets)} students?"): return
+        codes = [s["code"] for s in targets]
+        self.history.record(f"delete {len(codes)} students", [(s.fields(), None) for s in targets])
+        for code in codes:
+            # removing can compact the store, so rows are looked up again each time
+            self.students.remove(self.students.get(code))
+        self._persist([("D", c) for c in codes])
+        self._table_replaced(self.students.__contains__)
+        self.status_var.set(f"Deleted {len(codes)} students")
+
+    def bulk_adjust(self):
+        targets = [r["code"] for r in self._bulk_targets("Adjust marks for")]
+        if not targets: return
+        win = self._dialog("Adjust Marks")
+        frm = ttk.Frame(win, padding=12); frm.pack(fill=tk.BOTH, expand=True)
+        # position in the field tuple and the highest allowed mark
+        labels = {"Coursework 1": (2, 20), "Coursework 2": (3, 20), "Coursework 3": (4, 20), "Exam": (5, 100)}
+        ttk.Label(frm, text=f"Adjust {len(targets)} students").grid(row=0, column=0, columnspan=2, sticky=tk.W)
+        ttk.Label(frm, text="Mark").grid(row=1, column=0, sticky=tk.W, pady=6)
+        field = ttk.Combobox(frm, values=list(labels), state="readonly", width=20); field.set("Exam")
+        field.grid(row=1, column=1, pady=6, padx=(8,0))
+        ttk.Label(frm, text="Change by (+/-)").grid(row=2, column=0, sticky=tk.W, pady=6)
+        delta_entry = ttk.Entry(frm, width=22); delta_entry.insert(0, "+2"); delta_entry.grid(row=2, column=1, pady=6, padx=(8,0))
+
+        def submit():
+            try: delta = int(delta_entry.get())
+            except ValueError: messagebox.showerror("Invalid", "The change must be a whole number."); return
+            if self._is_loading(): return
+            col, top = labels[field.get()]
+            clamped = 0
+            changes = []
+            for record in filter(None, map(self.students.get, targets)):
+                fields = list(record.fields())
+                mark = fields[col] + delta
+                if not 0 <= mark <= top:
+                    clamped += 1; mark = max(0, min(top, mark))
+                if mark != fields[col]:
+                    fields[col] = mark; changes.append((record, tuple(fields)))
+            if changes: self.history.record(f"adjust {len(changes)} students", [(r.fields(), f) for r, f in changes])
+            for record, fields in changes:
+                self.students.update(record, fields)
+            self._persist([("U", record) for record, _ in changes])
+            match = self._match
+            self._table_replaced(lambda c: match is None or match(self.students.get(c)), resort=True)
+            win.destroy()
+            msg = f"Adjusted {field.get().lower()} by {delta:+d} for {len(changes)} students"
+            self.status_var.set(msg + (f" ({clamped} capped at 0 or {top})" if clamped else ""))
+
+        ttk.Button(frm, text="Apply", command=submit, style="Accent.TButton").grid(row=3, column=0, columnspan=2, pady=(8,6))
+
  
     # Sorting and stats
   
     def sort_records(self, ascending=True):
-        self.students.sort(key=lambda s: s["percent"], reverse=not ascending)
-        save_students(self.students)
-        self._populate_table()
-        self.status_var.set(f"Sorted records ({'ascending' if ascending else 'descending'})")
+        self.sort_by("percent", not ascending)
+
+    def sort_by(self, key, descending=None):
+        # Orders the current view only; the store and the file keep their order.
+        # Clicking the sorted heading again flips the direction.
+        if self._is_loading(): return
+        if descending is None:
+            descending = self._sort == (key, False)
+        started = self.timer.start()
+        self.history.record(f"sort by {self.headings[key]}", sort=(self._sort, (key, descending)))
+        self._set_sort((key, descending))
+        self.status_var.set(f"Sorted by {self.headings[key]} ({'descending' if descending else 'ascending'})")
+        self._show_timing(self.timer.stop(started, "sort", len(self.view)))
+
+    def _set_sort(self, sort):
+        self._sort = sort
+        if sort is None:
+            # back to storage order
+            order = self.students.live_codes()
+            if len(self.view) != len(order):
+                wanted = set(self.view)
+                order = [c for c in order if c in wanted]
+            self.view = order
+        else:
+            self.view = self._sorted(self.view)
+        self.view_top = 0
+        self._render(force=True)
+        for col, text in self.headings.items():
+            arrow = (" \u25bc" if sort[1] else " \u25b2") if sort and col == sort[0] else ""
+            self.tree.heading(col, text=text + arrow)
+
+    def _sorted(self, codes):
+        key, descending = self._sort
+        if len(codes) * 8 < len(self.students):
+            # a small view sorts faster on its own than by filtering a full order
+            ordered = sorted(codes, key=self._view_key())
+            return ordered[::-1] if descending else ordered
+        order = self.sort_cache.order(self.students, key)
+        if len(codes) != len(self.students):
+            wanted = set(codes)
+            order = [c for c in order if c in wanted]
+        return order[::-1] if descending else list(order)
 
     def show_highest(self):
+        if self._is_loading(): return
         if not self.students: messagebox.showinfo("No data","No students"); return
-        top=max(self.students,key=lambda s:s["percent"]); self._populate_table([top])
+        top=self.students.get(self.rank_index.highest()); self._populate_table([top], lambda s, c=top["code"]: s["code"]==c)
         self.status_var.set(f"Highest overall: {top['code']} - {top['name']}")
 
     def show_lowest(self):
+        if self._is_loading(): return
         if not self.students: messagebox.showinfo("No data","No students"); return
-        low=min(self.students,key=lambda s:s["percent"]); self._populate_table([low])
+        low=self.students.get(self.rank_index.lowest()); self._populate_table([low], lambda s, c=low["code"]: s["code"]==c)
         self.status_var.set(f"Lowest overall: {low['code']} - {low['name']}")
 
+    def show_ranked(self, best=True):
+        if self._is_loading(): return
+        if not self.students: messagebox.showinfo("No data","No students"); return
+        k = simpledialog.askinteger("Top N" if best else "Bottom N", "How many students?", minvalue=1, initialvalue=10)
+        if not k: return
+        codes = self.rank_index.top(k) if best else self.rank_index.bottom(k)
+        self._show_codes(codes, lambda s, keep=set(codes): s["code"] in keep)
+        self.status_var.set(f"{'Top' if best else 'Bottom'} {len(codes)} students by overall mark")
+
+    def show_rank(self):
+        if self._is_loading(): return
+        code = simpledialog.askstring("Student Rank", "Enter Student Number:")
+        if not code: return
+        student = self.students.get(code.strip())
+        if not student: messagebox.showinfo("Not found", "Student not found."); return
+        rank, pct = self.rank_index.rank(student), self.rank_index.percentile(student)
+        messagebox.showinfo("Student Rank", f"{student['code']} - {student['name']}\n"
+                            f"Rank: {rank} of {len(self.students)}\n"
+                            f"Scored higher than {pct:.1f}% of the class")
+
+    def query_students(self, text=None):
+        if self._is_loading(): return
+        text = text or simpledialog.askstring("Query Students",
+            "Conditions joined with 'and', for example:\n"
+            "  grade == A\n  percent between 40 and 50\n  exam < 40 and cw_total > 45\n"
+            f"Fields: {', '.join(QUERY_FIELDS)}", parent=self)
+        if not text: return
+        try:
+            codes, match, plan, ms = self.queries.run(text)
+        except ValueError as exc:
+            messagebox.showerror("Query", str(exc)); return
+        self._show_codes(codes, match)
+        self.status_var.set(f"{len(codes)} students match '{text.strip()}' in {ms:.1f} ms ({plan})")
+
+    def show_failed_exam(self):
+        # Failing is an exam mark below the lowest passing grade's minimum
+        pass_mark = GRADE_BOUNDARIES[-2][1] if len(GRADE_BOUNDARIES) > 1 else 0
+        self.query_students(f"exam < {pass_mark:g}")
+
+    def show_statistics(self):
+        if self._is_loading(): return
+        if not self.students: messagebox.showinfo("No data","No students"); return
+        started = time.perf_counter()
+        st = cohort_stats(self.students)
+        elapsed = (time.perf_counter() - started) * 1000
+        win = tk.Toplevel(self); win.title("Cohort Statistics"); win.transient(self)
+        frm = ttk.Frame(win, padding=12); frm.pack(fill=tk.BOTH, expand=True)
+        summary = [("Students", f"{st['count']}"), ("Mean", f"{st['mean']:.2f}%"), ("Median", f"{st['median']:.2f}%"),
+                   ("Std dev", f"{st['std']:.2f}"), ("Quartiles", f"{st['q1']:.2f}% / {st['q3']:.2f}%"),
+                   ("Grades", "  ".join(f"{g}: {c}" for g, c in st["grades"].items())),
+                   ("Correlation with exam", "  ".join(f"{k}: {v:+.2f}" for k, v in st["correlation"].items()))]
+        for i, (label, value) in enumerate(summary):
+            ttk.Label(frm, text=label, font=("Segoe UI", 10, "bold")).grid(row=i, column=0, sticky=tk.W, pady=2)
+            ttk.Label(frm, text=value).grid(row=i, column=1, sticky=tk.W, padx=(10,0), pady=2)
+        text = tk.Text(frm, width=70, height=16, font=("Consolas", 9), relief=tk.FLAT)
+        text.grid(row=len(summary), column=0, columnspan=2, pady=(10,0), sticky="nsew")
+        for col, hist in st["histograms"].items():
+            # exam marks are grouped in tens so every histogram fits on a few lines
+            bins = [(f"{v:>3}", c) for v, c in enumerate(hist)] if col != "exam" else \
+                   [(f"{v:>3}", sum(hist[v:v + 10])) for v in range(0, 101, 10)]
+            peak = max(c for _, c in bins) or 1
+            text.insert(tk.END, f"{col}\n")
+            for label, count in bins:
+                text.insert(tk.END, f"  {label} {'#' * round(40 * count / peak):<40} {count}\n")
+        text.configure(state="disabled")
+        engine = "NumPy" if np is not None else "pure Python"
+        ttk.Label(frm, text=f"Computed in {elapsed:.1f} ms ({engine})").grid(row=len(summary)+1, column=0, columnspan=2, sticky=tk.W, pady=(6,0))
+
+    def edit_grade_boundaries(self):
+        if self._is_loading(): return
+        win = self._dialog("Grade Boundaries")
+        frm = ttk.Frame(win, padding=12); frm.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(frm, text="Minimum percentage for each grade").grid(row=0, column=0, columnspan=2, sticky=tk.W, pady=(0,6))
+        entries = []
+        for i, (grade, minimum) in enumerate(GRADE_BOUNDARIES[:-1], start=1):
+            ttk.Label(frm, text=grade).grid(row=i, column=0, sticky=tk.W, pady=4)
+            ent = ttk.Entry(frm, width=10); ent.insert(0, f"{minimum:g}"); ent.grid(row=i, column=1, pady=4, padx=(8,0))
+            entries.append((grade, ent))
+        ttk.Label(frm, text=f"{GRADE_BOUNDARIES[-1][0]}: anything lower").grid(row=len(entries)+1, column=0, columnspan=2, sticky=tk.W, pady=4)
+
+        def submit():
+            try:
+                boundaries = [(g, float(ent.get())) for g, ent in entries] + [(GRADE_BOUNDARIES[-1][0], 0)]
+                old = set_grade_boundaries(boundaries)
+            except ValueError:
+                messagebox.showerror("Invalid", "Minimums must be numbers, each lower than the grade above and above 0."); return
+            try: save_grade_boundaries()
+            except OSError as exc: messagebox.showerror("Save Error", f"Could not write {GRADE_FILE}:\n{exc}")
+            win.destroy()
+            started = self.timer.start()
+            changed = regrade(self.students, old, self.rank_index)
+            self.sort_cache.invalidate()
+            self._table_regraded(changed)
+            self.status_var.set(f"Grade boundaries updated: {len(changed)} students changed grade")
+            self._show_timing(self.timer.stop(started, "regrade", len(changed)))
+
+        ttk.Button(frm, text="Apply", command=submit, style="Accent.TButton").grid(row=len(entries)+2, column=0, columnspan=2, pady=(8,6))
+
+    def _table_regraded(self, codes):
+        # Only rows whose grade moved are touched; rows scrolled out of the tree
+        # pick up the new grade when they are next rendered
+        if not codes: return
+        if self._match is not None:
+            shown = set(self.view)
+            if any(c not in shown and self._match(self.students.get(c)) for c in codes):
+                # students that now match the filter are picked up by rebuilding the view
+                self._refresh_view()
+                return
+        gone = {c for c in codes if not self._match(self.students.get(c))} if self._match is not None else set()
+        # a grade sort is the only order the boundaries can change
+        resort = self._sort is not None and self._sort[0] == "grade"
+        if gone or resort:
+            self._table_replaced(lambda c: c not in gone, resort)
+            return
+        changed = set(codes)
+        start, end = self._block
+        for code in self.view[start:end]:
+            if code in changed:
+                self.tree.item(code, values=self._row_values(self.students.get(code)))
+
    
     # Help/About
     
     def show_help(self):
-        messagebox.showinfo("How to Use","Double-click rows to view, File to sort or view and exit app, Edit to add, delete, or update data, search by name or code.")
+        messagebox.showinfo("How to Use","Double-click rows to view, click a column heading to sort (again to reverse), File to view and exit app, Edit to add, delete, or update data, search by name or code. Ctrl/Shift-click or Ctrl+A selects several rows for bulk delete or mark changes (Edit menu).")
 
     def show_about(self):
         messagebox.showinfo("About","Student Manager\nSupports Add/Update/Delete/Sort.")
 
 
+# Command line
+#
+# Running the script with a command works without opening a window:
+#   validate FILE       count good, malformed and duplicate rows
+#   report FILE         class size, average, grade split, highest and lowest
+#   regrade FILE OUT    write code,name,percent,grade for every student
+#   export FILE OUT     convert between formats (.txt / .db), or write every
+#                       field including grades (.csv / .jsonl)
+#   reports FILE DIR    write one text report per student into DIR
+#   import SRC DEST     merge the students in SRC into DEST (SRC wins on clashes)
+# Large text files are cut into byte ranges on line boundaries and each range
+# is parsed by its own process.
+# Grades follow gradeBoundaries.txt when it exists, as in the window.
+
+CLI_COMMANDS = ("validate", "report", "regrade", "export", "import", "reports")
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+def _byte_ranges(filename, parts):
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, "rb") as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, bounds[-1]))
+            f.readline()  # a range starts at the beginning of a line
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+def _new_scan():
+    # codes, names and overalls hold one entry per kept row, in file order
+    return {"rows": 0, "malformed": 0, "duplicates": 0, "hist": [0] * 161,
+            "codes": [], "names": [], "overalls": bytearray()}
+
+def _scan_fields(result, fields, mode, out, seen):
+    # Duplicate codes follow the loader: the first row with a code wins
+    if fields[0] in seen:
+        result["duplicates"] += 1
+        return
+    seen.add(fields[0])
+    student = Student(*fields)
+    overall = student.overall
+    result["rows"] += 1
+    result["hist"][overall] += 1
+    result["codes"].append(student.code); result["names"].append(student.name); result["overalls"].append(overall)
+    if mode == "regrade":
+        out.write(f"{student.code},{student.name},{student.percent:.2f},{student.grade}\n")
+
+def _scan_range(task):
+    # Runs in a worker process: parses the lines that start inside [start, end)
+    filename, start, end, mode, out_path, boundaries = task
+    # worker processes may start from a fresh import, so the boundaries travel with the task
+    set_grade_boundaries(boundaries)
+    result, seen = _new_scan(), set()
+    out = open(out_path, "w", encoding="utf-8") if out_path else None
+    try:
+        with open(filename, "rb") as f:
+            f.seek(start)
+            pos = start
+            while pos < end:
+                raw = f.readline()
+                if not raw: break
+                first, pos = pos == 0, pos + len(raw)
+                line = decode_student_line(raw)
+                if line is None:
+                    result["malformed"] += 1
+                    continue
+                if not line or (first and line.isdigit()):
+                    continue
+                fields = parse_student_line(line)
+                if fields is None:
+                    result["malformed"] += 1
+                else:
+                    _scan_fields(result, fields, mode, out, seen)
+    finally:
+        if out: out.close()
+    return result
+
+def _drop_repeats(results):
+    # Ranges only know their own codes, so a code already kept by an earlier
+    # range is dropped here. Returns the dropped row positions of each range.
+    seen, dropped = set(), []
+    for r in results:
+        drop = {i for i, code in enumerate(r["codes"]) if code in seen} if seen else set()
+        seen.update(r["codes"])
+        for i in drop:
+            r["hist"][r["overalls"][i]] -= 1
+        if drop:
+            keep = [i for i in range(len(r["codes"])) if i not in drop]
+            for key in ("codes", "names"):
+                r[key] = [r[key][i] for i in keep]
+            r["overalls"] = bytearray(r["overalls"][i] for i in keep)
+            r["rows"] -= len(drop); r["duplicates"] += len(drop)
+        dropped.append(drop)
+    return dropped
+
+def scan_students(filename, mode="report", out_path=None, workers=None):
+    # mode is "report", "validate" or "regrade" (writes out_path)
+    with open_backend(filename) as backend:
+        if isinstance(backend, SQLiteBackend) and not out_path:
+            # codes are unique in the table, so a summary needs no row scan
+            best, worst = backend.highest(), backend.lowest()
+            return {"rows": backend.count(), "malformed": 0, "duplicates": 0, "hist": backend.histogram(),
+                    "best": best and (best.overall, best.code, best.name),
+                    "worst": worst and (worst.overall, worst.code, worst.name)}
+        # unsaved journal edits can touch any row, so byte ranges would miss them
+        text = isinstance(backend, TextBackend) and not backend.read_journal()
+    if text:
+        workers = workers or os.cpu_count() or 1
+        parts = workers * 4 if os.path.getsize(filename) >= PARALLEL_MIN_BYTES else 1
+        tasks = [(filename, a, b, mode, f"{out_path}.part{i}" if out_path else None, GRADE_BOUNDARIES)
+                 for i, (a, b) in enumerate(_byte_ranges(filename, parts))]
+        try:
+            if len(tasks) > 1:
+                with ProcessPoolExecutor(workers) as pool:
+                    results = list(pool.map(_scan_range, tasks))
+            else:
+                results = [_scan_range(t) for t in tasks]
+            dropped = _drop_repeats(results)
+            if out_path:
+                # stitch the per-range outputs back together in file order
+                with open(out_path + ".tmp", "wb") as out:
+                    for t, drop in zip(tasks, dropped):
+                        with open(t[4], "rb") as part:
+                            if drop:
+                                out.writelines(line for i, line in enumerate(part) if i not in drop)
+                            else:
+                                out.write(part.read())
+                os.replace(out_path + ".tmp", out_path)
+        finally:
+            # a failed range must not leave its part files behind
+            for path in ([t[4] for t in tasks] + [out_path + ".tmp"]) if out_path else []:
+                if os.path.exists(path): os.remove(path)
+    else:
+        result, seen, stats = _new_scan(), set(), {}
+        with open(out_path, "w", encoding="utf-8") if out_path else open(os.devnull, "w") as out:
+            for s in load_students(filename, stats):
+                _scan_fields(result, s.fields(), mode, out, seen)
+        result["malformed"], result["duplicates"] = stats.get("malformed", 0), stats.get("duplicates", 0)
+        results = [result]
+    total = {"rows": 0, "malformed": 0, "duplicates": 0, "hist": [0] * 161, "best": None, "worst": None}
+    for r in results:
+        for key in ("rows", "malformed", "duplicates"):
+            total[key] += r[key]
+        total["hist"] = [a + b for a, b in zip(total["hist"], r["hist"])]
+        if not r["rows"]: continue
+        # the first row with the highest (lowest) mark, as a serial scan would pick
+        hi, lo = max(r["overalls"]), min(r["overalls"])
+        if total["best"] is None or hi > total["best"][0]:
+            i = r["overalls"].index(hi); total["best"] = (hi, r["codes"][i], r["names"][i])
+        if total["worst"] is None or lo < total["worst"][0]:
+            i = r["overalls"].index(lo); total["worst"] = (lo, r["codes"][i], r["names"][i])
+    return total
+
+def _print_report(total):
+    n = total["rows"]
+    print(f"Students: {n}")
+    if not n: return
+    mean = sum(v * c for v, c in enumerate(total["hist"])) / n / 160 * 100
+    grades = {g: 0 for g in GRADE_NAMES}
+    for overall, count in enumerate(total["hist"]):
+        grades[GRADE_BY_OVERALL[overall]] += count
+    print(f"Average percentage: {mean:.2f}%")
+    print("Grades: " + "  ".join(f"{g}: {c}" for g, c in grades.items()))
+    for label, (overall, code, name) in (("Highest", total["best"]), ("Lowest", total["worst"])):
+        print(f"{label}: {code} - {name} ({overall / 160 * 100:.2f}%)")
+
+def cli(argv):
+    parser = argparse.ArgumentParser(prog="Exercise3_Student_Manager.py", description="Student Manager batch tools")
+    parser.add_argument("--workers", type=int, default=None, help="processes used to parse text files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("validate", help="check every row of a marks file").add_argument("file")
+    sub.add_parser("report", help="print a cohort summary").add_argument("file")
+    for name, help_text in (("regrade", "write percent and grade for every student"),
+                            ("export", "convert to another format (.txt, .db, .csv or .jsonl)"),
+                            ("reports", "write a report file per student into a folder"),
+                            ("import", "merge students from another file")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("file" if name != "import" else "source")
+        cmd.add_argument("out" if name != "import" else "dest")
+    args = parser.parse_args(argv)
+    try:
+        return _run_command(args)
+    except OSError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+
+def _run_command(args):
+    if args.command in ("validate", "report"):
+        total = scan_students(args.file, args.command, workers=args.workers)
+        _print_report(total)
+        if args.command == "validate":
+            print(f"Malformed lines: {total['malformed']}\nDuplicate codes: {total['duplicates']}")
+            return 1 if total["malformed"] or total["duplicates"] else 0
+        elif total["duplicates"]:
+            print(f"Skipped {total['duplicates']} rows repeating an earlier code")
+    elif args.command == "regrade":
+        total = scan_students(args.file, "regrade", args.out, workers=args.workers)
+        print(f"Wrote {total['rows']} students to {args.out}"
+              + (f" (skipped {total['duplicates']} rows repeating an earlier code)" if total["duplicates"] else ""))
+    elif args.command == "export" and export_format(args.out):
+        n = export_students(iter_stored_students(args.file), args.out)
+        print(f"Exported {n} students to {args.out}")
+    elif args.command == "reports":
+        n = write_reports(iter_stored_students(args.file), args.out, args.workers)
+        print(f"Wrote {n} student reports to {args.out}")
+    elif args.command == "export":
+        with open_backend(args.file) as source, open_backend(args.out) as target:
+            # between the two formats rows stream straight across; a text file
+            # with unsaved journal edits has to be loaded to apply them
+            if isinstance(source, TextBackend) and isinstance(target, SQLiteBackend) and not source.read_journal():
+                n = target.import_text(args.file, replace=True)[0]
+            elif isinstance(source, SQLiteBackend) and isinstance(target, TextBackend):
+                n = source.export_text(args.out)
+            else:
+                students = load_students(args.file)
+                save_students(students, args.out)
+                n = len(students)
+        print(f"Exported {n} students to {args.out}")
+    elif args.command == "import":
+        stats = {}
+        with open_backend(args.source) as source, open_backend(args.dest) as dest:
+            if isinstance(source, TextBackend) and isinstance(dest, SQLiteBackend) and not source.read_journal():
+                added, updated = dest.import_text(args.source, stats)
+            else:
+                students = load_students(args.dest) if os.path.exists(args.dest) else StudentStore()
+                added = updated = 0
+                seen = set()  # the first row for a code in the source wins, as in import_text
+                for chunk in source.iter_chunks(stats=stats):
+                    for fields in chunk:
+                        if fields[0] in seen: continue
+                        seen.add(fields[0])
+                        record = students.get(fields[0])
+                        if record: students.update(record, fields); updated += 1
+                        else: students.append(fields); added += 1
+                save_students(students, args.dest)
+        print(f"Imported {added} new and {updated} updated students into {args.dest} "
+              f"({stats.get('malformed', 0)} malformed lines skipped)")
+    return 0
+
+
 # Run
 
 if __name__ == "__main__":
-    app = StudentManager()
+    args = sys.argv[1:]
+    try:
+        load_grade_boundaries()
+    except (ValueError, OSError) as exc:
+        print(f"Using the default grade boundaries: {exc}", file=sys.stderr)
+    if any(a in CLI_COMMANDS for a in args) or "-h" in args or "--help" in args:
+        sys.exit(cli(args))
+    data_file = args[args.index("--data") + 1] if "--data" in args[:-1] else DATA_FILE
+    app = StudentManager(data_file, lazy="--lazy" in args, timings="--timings" in args)
     try:
         app.iconbitmap("studentmanagericon.ico")
     except Exception: